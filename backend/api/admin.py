@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
-from .models import CustomUser, Profile, DayEntry, Attachment
+from .models import CustomUser, Profile, DayEntry, Attachment, SummaryJob, Blob, Recap
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -44,3 +44,21 @@ class AttachmentAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at",)
     def file_name(self, obj):
         return obj.file.name
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("id", "content_hash", "size", "ref_count", "created_at")
+    search_fields = ("content_hash",)
+    readonly_fields = ("created_at",)
+
+@admin.register(SummaryJob)
+class SummaryJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "day_entry", "style", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status", "style")
+    readonly_fields = ("created_at", "started_at", "finished_at")
+
+@admin.register(Recap)
+class RecapAdmin(admin.ModelAdmin):
+    list_display = ("id", "profile", "period", "start", "end", "style", "updated_at")
+    list_filter = ("period", "style")
+    readonly_fields = ("created_at", "updated_at")
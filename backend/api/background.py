@@ -0,0 +1,39 @@
+# api/background.py
+# Per-process thread pools for work that shouldn't hold up the request
+# (summary jobs, upload derivatives). Work is submitted on commit so the
+# pool thread always sees the rows the request just wrote, and runs under the
+# submitting request's correlation id.
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def _run(request_id: str, fn, *args):
+    with metrics.bound_request_id(request_id):
+        try:
+            fn(*args)
+        except Exception:
+            log.exception("background.failed fn=%s args=%s", getattr(fn, "__name__", fn), args)
+        finally:
+            connection.close()  # pool threads outlive requests; don't leak their connections
+
+
+def submit_on_commit(name: str, max_workers: int, fn, *args):
+    request_id = metrics.current_request_id()
+    transaction.on_commit(lambda: get_executor(name, max_workers).submit(_run, request_id, fn, *args))
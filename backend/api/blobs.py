@@ -0,0 +1,117 @@
+# api/blobs.py
+# Content-addressed storage for attachments. Each distinct file is stored once
+# as a Blob named by its sha256; every Attachment that holds those bytes takes
+# a reference, and the blob (with its derivatives) is deleted only when the
+# last reference goes. Uploading a photo that's already stored costs a lookup
+# and a counter bump instead of a copy and another round of image processing.
+import hashlib
+import logging
+import os
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from . import metrics
+from .models import Attachment, Blob
+
+log = logging.getLogger(__name__)
+
+CREATE_ATTEMPTS = 3
+
+
+def hash_file(f) -> str:
+    # Uploads through HashingTemporaryFileUploadHandler arrive already hashed
+    if getattr(f, "content_hash", None):
+        return f.content_hash
+    h = hashlib.sha256()
+    for chunk in f.chunks():
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def _blob_name(content_hash: str, filename: str) -> str:
+    return content_hash + os.path.splitext(filename)[1].lower()[:10]
+
+
+def _add_refs(counts: Counter):
+    Blob.objects.filter(content_hash__in=counts).update(ref_count=F("ref_count") + Case(
+        *(When(content_hash=h, then=Value(n)) for h, n in counts.items()), default=Value(0)))
+
+
+def acquire(files) -> list:
+    """Blob for each uploaded file, storing only content not seen before.
+
+    Takes one reference per file (a photo repeated in the batch counts twice)
+    and runs a fixed number of queries however many files there are.
+    """
+    hashes = [hash_file(f) for f in files]
+    counts = Counter(hashes)
+    for attempt in range(CREATE_ATTEMPTS):
+        stored = []
+        try:
+            with transaction.atomic():
+                known = {b.content_hash: b for b in
+                         Blob.objects.select_for_update().filter(content_hash__in=counts)}
+                new = []
+                for h, f in zip(hashes, files):
+                    if h not in known:
+                        blob = Blob(content_hash=h, size=f.size)
+                        with metrics.timed("storage"):
+                            blob.file.save(_blob_name(h, f.name), f, save=False)
+                        stored.append(blob.file)
+                        known[h] = blob
+                        new.append(blob)
+                Blob.objects.bulk_create(new)
+                _add_refs(counts)
+        except IntegrityError:
+            # Another upload stored the same new content first; use theirs
+            for f in stored:
+                f.delete(save=False)
+            if attempt == CREATE_ATTEMPTS - 1:
+                raise
+            continue
+        except Exception:
+            for f in stored:
+                f.delete(save=False)
+            raise
+        log.debug("blobs.acquire files=%d new=%d", len(files), len(stored))
+        return [known[h] for h in hashes]
+
+
+def adopt(name: str, content_hash: str, size: int) -> Blob:
+    """Blob for a file the client already put in storage (see api/direct.py).
+
+    When the content is already stored the new copy is dropped.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(content_hash=content_hash).first()
+        if blob is None:
+            return Blob.objects.create(content_hash=content_hash, file=name, size=size, ref_count=1)
+        _add_refs(Counter([content_hash]))
+        if name != blob.file.name:  # the same upload confirmed again is the blob's own file
+            duplicate = Blob(file=name).file
+            transaction.on_commit(lambda: duplicate.delete(save=False))
+    return blob
+
+
+def attachment_for(blob: Blob, entry) -> Attachment:
+    """Unsaved Attachment of ``blob`` on ``entry``, with any derivatives already built for it."""
+    return Attachment(blob=blob, file=blob.file.name, content_hash=blob.content_hash,
+                      owner_profile_id=entry.profile_id, day_entry=entry,
+                      model_input=blob.model_input.name, thumbnail=blob.thumbnail.name,
+                      width=blob.width, height=blob.height)
+
+
+def release(blob_id: int):
+    """Drop one reference; the last one deletes the blob and its files."""
+    with transaction.atomic():
+        Blob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+        orphan = Blob.objects.filter(pk=blob_id, ref_count=0).first()
+        if orphan is None:
+            return
+        files = [f for f in (orphan.file, orphan.model_input, orphan.thumbnail) if f]
+        orphan.delete()
+        transaction.on_commit(lambda: [f.delete(save=False) for f in files])
+    log.debug("blobs.deleted content_hash=%s", orphan.content_hash)
@@ -0,0 +1,74 @@
+# api/caching.py
+# Response caches that depend on a profile's entries. Calendar payloads are
+# keyed on a version read from the DB (see DayEntryCalendarView), not on a
+# counter kept in the cache: with the default per-process cache a counter
+# bumped by one worker would leave the others serving stale ranges.
+#
+# Also the per-user profile list and the set of profile ids a user owns, so
+# ownership checks on the hot path don't need a query. Those keys are fixed
+# and deleted outright whenever a profile changes. The cache may be per
+# process, so a miss in the id set is confirmed against the DB before it
+# counts as "not yours"; only positive answers are ever cached.
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Profile
+
+CALENDAR_TTL = 24 * 3600
+
+
+def calendar_key(profile_id: int, version: str, start, end) -> str:
+    return f"calendar:{profile_id}:{version}:{start.isoformat()}:{end.isoformat()}"
+
+
+def get_calendar(key: str):
+    return cache.get(key)
+
+
+def set_calendar(key: str, data):
+    cache.set(key, data, CALENDAR_TTL)
+
+
+def _profile_ids_key(user_id: int) -> str:
+    return f"profile_ids:{user_id}"
+
+
+def _profiles_key(user_id: int) -> str:
+    return f"profiles:{user_id}"
+
+
+def _profiles_ttl() -> int:
+    # Cached avatar URLs are signed (api/media.py); drop them before they expire
+    return min(3600, settings.MEDIA_URL_TTL)
+
+
+def owned_profile_ids(user_id: int) -> frozenset:
+    ids = cache.get(_profile_ids_key(user_id))
+    if ids is None:
+        ids = frozenset(Profile.objects.filter(owner_id=user_id).values_list("id", flat=True))
+        cache.set(_profile_ids_key(user_id), ids, _profiles_ttl())
+    return ids
+
+
+def owns_profile(user_id: int, profile_id: int) -> bool:
+    if profile_id in owned_profile_ids(user_id):
+        return True
+    # Possibly created through another process since this one cached the set
+    if not Profile.objects.filter(id=profile_id, owner_id=user_id).exists():
+        return False
+    invalidate_profiles(user_id)
+    owned_profile_ids(user_id)
+    return True
+
+
+def get_profiles(user_id: int):
+    return cache.get(_profiles_key(user_id))
+
+
+def set_profiles(user_id: int, data: list):
+    cache.set_many({_profiles_key(user_id): data,
+                    _profile_ids_key(user_id): frozenset(p["id"] for p in data)}, _profiles_ttl())
+
+
+def invalidate_profiles(user_id: int):
+    cache.delete_many([_profiles_key(user_id), _profile_ids_key(user_id)])
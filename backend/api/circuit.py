@@ -0,0 +1,117 @@
+# api/circuit.py
+# Per-process circuit breaker for outbound service calls. After enough
+# consecutive failures (or calls slower than slow_call_seconds) it opens and
+# callers fail fast; after reset_seconds a single probe call is let through
+# (half-open) and its outcome decides whether to close or re-open.
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 10.0,
+                 reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.transitions = Counter()
+        self.calls = Counter()
+
+    def _transition(self, state: str):
+        # caller holds the lock
+        self.transitions[f"{self._state}->{state}"] += 1
+        log.warning("circuit.%s %s->%s failures=%d", self.name, self._state, state, self._failures)
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CLOSED:
+            self._failures = 0
+
+    def _current_state(self) -> str:
+        # caller holds the lock
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probe_in_flight):
+                self.calls["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} circuit is {state}")
+            if state == HALF_OPEN:
+                self._probe_in_flight = True
+            self.calls["attempted"] += 1
+
+    def _failed(self):
+        # caller holds the lock
+        self.calls["failed"] += 1
+        self._probe_in_flight = False
+        self._failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._transition(OPEN)
+
+    def record_success(self, duration: float = 0.0):
+        with self._lock:
+            if duration > self.slow_call_seconds:
+                self.calls["slow"] += 1
+                return self._failed()
+            self.calls["succeeded"] += 1
+            self._probe_in_flight = False
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failed()
+
+    def abandon(self):
+        """The call went away without an outcome (e.g. the client disconnected)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    @contextmanager
+    def call(self):
+        self.before_call()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "transitions": dict(self.transitions),
+                "calls": dict(self.calls),
+            }
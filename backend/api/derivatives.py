@@ -0,0 +1,80 @@
+# api/derivatives.py
+# Upload-time image derivatives: a small JPEG for the model, a thumbnail for
+# listings, and the original's dimensions. Built once per blob in the
+# background so summary generation and the frontend never re-process
+# full-size originals, and a re-uploaded photo is never processed again.
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image as PILImage, UnidentifiedImageError
+
+from .models import Attachment, DayEntry
+from . import background
+
+log = logging.getLogger(__name__)
+
+
+def _render_jpeg(img, max_edge: int, quality: int) -> bytes:
+    img = img.copy()
+    img.thumbnail((max_edge, max_edge))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def _build(target, stem: str, attachment_id: int) -> bool:
+    """Render derivatives onto ``target`` (a Blob, or a pre-dedup Attachment)."""
+    try:
+        with target.file.open("rb") as f:
+            img = PILImage.open(f)
+            width, height = img.size
+            # JPEG decodes straight to 1/2, 1/4 or 1/8 scale; thumbnail() finishes the job
+            img.draft("RGB", (settings.MODEL_INPUT_MAX_EDGE, settings.MODEL_INPUT_MAX_EDGE))
+            img.load()
+    except (UnidentifiedImageError, OSError) as e:
+        log.debug("derivatives.skip attachment_id=%s reason=%s", attachment_id, e)
+        return False
+
+    model_input = _render_jpeg(img, settings.MODEL_INPUT_MAX_EDGE, 85)
+    thumbnail = _render_jpeg(img, settings.THUMBNAIL_MAX_EDGE, 80)
+    target.width, target.height = width, height
+    target.model_input.save(f"{stem}_model.jpg", ContentFile(model_input), save=False)
+    target.thumbnail.save(f"{stem}_thumb.jpg", ContentFile(thumbnail), save=False)
+    target.save(update_fields=["width", "height", "model_input", "thumbnail"])
+    log.debug("derivatives.built attachment_id=%s size=%sx%s model_bytes=%d thumb_bytes=%d",
+              attachment_id, width, height, len(model_input), len(thumbnail))
+    return True
+
+
+def build_derivatives(attachment_id: int):
+    att = Attachment.objects.select_related("blob").filter(id=attachment_id).first()
+    if att is None or not att.file:
+        return
+    # Built once per blob and shared; rows from before deduplication own theirs
+    target = att.blob or att
+    if not target.thumbnail and not _build(target, att.content_hash or att.ensure_content_hash(), att.id):
+        return
+    if att.blob_id:
+        # Every row sharing the blob, including ones created while this ran
+        Attachment.objects.filter(blob_id=att.blob_id).update(
+            width=target.width, height=target.height,
+            model_input=target.model_input.name, thumbnail=target.thumbnail.name)
+        entries = DayEntry.objects.filter(attachments__blob_id=att.blob_id)
+    else:
+        entries = DayEntry.objects.filter(id=att.day_entry_id)
+    # Thumbnails are part of the entry payload, so its ETag (updated_at) must move
+    DayEntry.objects.filter(id__in=entries.values("id")).update(updated_at=timezone.now())
+
+
+def schedule(att: Attachment):
+    if att.thumbnail:  # copied from a blob that already has them
+        return
+    if settings.DERIVATIVES_BACKEND == "eager":
+        build_derivatives(att.id)
+    else:
+        background.submit_on_commit("derivatives", settings.DERIVATIVE_WORKERS, build_derivatives, att.id)
@@ -0,0 +1,104 @@
+# api/direct.py
+# Direct-to-storage transfers. With DIRECT_TRANSFERS on, the API hands out
+# short-lived presigned URLs: clients PUT and GET bytes against the object
+# store themselves and Django only records the row once the client confirms.
+#
+# S3-compatible storages (S3, MinIO, R2, ...) presign natively. The local
+# filesystem storage gets a stand-in: PUT URLs signed with SECRET_KEY that point
+# at DirectObjectView, which behaves like the bucket would (downloads use the
+# signed media URLs from api/media.py). Same flow and same client code in
+# development, tests and production.
+import base64
+import hashlib
+import os
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+SALT = "api.direct"
+READ_SIZE = 64 * 1024
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def _s3_client(storage):
+    # S3Storage and its subclasses; anything without a bucket is filesystem-like
+    return storage.bucket.meta.client if getattr(storage, "bucket_name", None) else None
+
+
+def new_key(upload_to: str, filename: str) -> str:
+    # Random keys never collide, so no exists() round trip before presigning
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    return f"{upload_to}{uuid.uuid4().hex}{ext}"
+
+
+def _sign(payload: dict) -> str:
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def load(token: str, op: str) -> dict:
+    """Payload of a token issued by this module; raises signing.BadSignature."""
+    payload = signing.loads(token, salt=SALT, max_age=settings.DIRECT_URL_TTL)
+    if payload.get("op") != op:
+        raise signing.BadSignature("wrong operation")
+    return payload
+
+
+def presign_put(request, key: str, content_type: str, size: int, sha256: str) -> dict:
+    """Where and how the client PUTs the bytes for ``key``.
+
+    The size and checksum are part of the signature, so the store itself
+    rejects a different file; the hash can be trusted without reading it back.
+    """
+    checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+    client = _s3_client(default_storage)
+    if client is not None:
+        url = client.generate_presigned_url("put_object", ExpiresIn=settings.DIRECT_URL_TTL, Params={
+            "Bucket": default_storage.bucket_name,
+            "Key": default_storage._normalize_name(key),
+            "ContentType": content_type,
+            "ContentLength": size,
+            "ChecksumSHA256": checksum,
+        })
+        headers = {"Content-Type": content_type, "x-amz-checksum-sha256": checksum}
+    else:
+        token = _sign({"op": "put", "k": key, "n": size, "h": sha256})
+        url = request.build_absolute_uri(reverse("direct_object", args=[token]))
+        headers = {"Content-Type": content_type}
+    return {"url": url, "method": "PUT", "headers": headers}
+
+
+def upload_ticket(**claims) -> str:
+    """Opaque token the client hands back to confirm an upload."""
+    return _sign({"op": "confirm", **claims})
+
+
+def stored(key: str) -> bool:
+    return default_storage.exists(key)
+
+
+def receive(key: str, stream, size: int, sha256: str):
+    """Filesystem stand-in for a presigned PUT: store ``size`` bytes if they hash to ``sha256``."""
+    h = hashlib.sha256()
+    received = 0
+    with tempfile.TemporaryFile() as tmp:
+        while received < size:
+            data = stream.read(min(READ_SIZE, size - received))
+            if not data:
+                break
+            h.update(data)
+            tmp.write(data)
+            received += len(data)
+        if received != size or stream.read(1) or h.hexdigest() != sha256:
+            raise ChecksumMismatch(key)
+        tmp.seek(0)
+        if default_storage.exists(key):  # a retried PUT overwrites, like a bucket would
+            default_storage.delete(key)
+        default_storage.save(key, File(tmp))
@@ -0,0 +1,77 @@
+# api/flights.py
+# Single-flight coalescing: of all callers asking for the same key at the same
+# time, one (the leader) does the work and the rest wait for what it publishes
+# instead of repeating it. Leases and results are Flight rows in Postgres, so
+# this holds across every worker process and host whatever cache is configured
+# (the default locmem cache is per process). Taking a lease is an INSERT that
+# loses on the primary key when another caller holds it.
+#
+# A leader that crashes or is killed holds its lease until lease_seconds runs
+# out; waiters then take over, so a lost leader delays a result but can't
+# wedge it. A published result stays readable for result_seconds, which also
+# answers callers that arrive just after the flight landed.
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Flight
+
+log = logging.getLogger(__name__)
+
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 0.5
+RESULT_SECONDS = 30
+
+
+class Lease:
+    def __init__(self, key: str, token: str):
+        self.key = key
+        self.token = token
+
+    def publish(self, value, result_seconds: int = RESULT_SECONDS):
+        """Hand ``value`` to everyone waiting on this key; that also ends the lease."""
+        Flight.objects.filter(key=self.key, token=self.token).update(
+            value={"value": value}, expires_at=timezone.now() + timedelta(seconds=result_seconds))
+
+    def release(self):
+        # Only drop our own lease; once it has expired another caller may hold it
+        Flight.objects.filter(key=self.key, token=self.token, value__isnull=True).delete()
+
+
+def _take_lease(key: str, lease_seconds: int):
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            Flight.objects.filter(expires_at__lte=now).delete()  # this key's stale lease and everyone's old results
+            Flight.objects.create(key=key, token=token, expires_at=now + timedelta(seconds=lease_seconds))
+    except IntegrityError:
+        return None
+    return Lease(key, token)
+
+
+def join(key: str, lease_seconds: int):
+    """``(lease, None)`` when the caller should do the work, ``(None, value)`` when another caller did.
+
+    A leader must end with ``lease.publish(value)``, or ``lease.release()``
+    when it fails without a value, which lets a waiter take over.
+    """
+    delay = POLL_SECONDS
+    waited = False
+    while True:
+        found = (Flight.objects.filter(key=key, value__isnull=False, expires_at__gt=timezone.now())
+                 .values_list("value", flat=True).first())
+        if found is not None:
+            if waited:
+                log.debug("flights.joined key=%s", key)
+            return None, found["value"]
+        lease = _take_lease(key, lease_seconds)
+        if lease is not None:
+            return lease, None
+        waited = True
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL_SECONDS)
@@ -0,0 +1,128 @@
+# api/jobs.py
+# Summary job queue. Jobs are SummaryJob rows, so any process can enqueue and
+# any worker can drain them. SUMMARY_QUEUE_BACKEND decides who does the draining:
+#   "thread"   - a per-process thread pool, kicked on commit (default, dev server)
+#   "database" - only `manage.py run_summary_workers` processes poll the table
+#   "eager"    - run inline on commit (tests, no outside services)
+#
+# A claim holds the job for SUMMARY_JOB_LEASE_SECONDS. A worker that dies
+# mid-run leaves its job RUNNING with a lease that runs out, and the next claim
+# takes it over. Failed runs go back to PENDING until a job has been attempted
+# SUMMARY_JOB_MAX_ATTEMPTS times, then it is FAILED for good. Thread-pool jobs
+# don't survive a restart; polling one (SummaryJobView) hands it to this
+# process's pool again.
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SummaryJob
+from . import background, summaries
+
+log = logging.getLogger(__name__)
+
+_process_started = timezone.now()
+
+
+def _dispatch(job_id: int):
+    backend = settings.SUMMARY_QUEUE_BACKEND
+    if backend == "eager":
+        transaction.on_commit(lambda: run_job(job_id))
+    elif backend == "thread":
+        background.submit_on_commit("summary-worker", settings.SUMMARY_WORKERS, run_job, job_id)
+
+
+def enqueue(entry, payload: dict, style: str) -> SummaryJob:
+    job = SummaryJob.objects.create(day_entry=entry, style=style, payload=payload)
+    _dispatch(job.id)
+    log.debug("summary_jobs.enqueue job_id=%s entry_id=%s style=%s backend=%s",
+              job.id, entry.id, style, settings.SUMMARY_QUEUE_BACKEND)
+    return job
+
+
+def _claimable(now):
+    # Pending, or running on a lease its worker didn't live to finish
+    return Q(status=SummaryJob.PENDING) | Q(
+        status=SummaryJob.RUNNING, lease_expires_at__lt=now, attempts__lt=settings.SUMMARY_JOB_MAX_ATTEMPTS)
+
+
+def reap() -> int:
+    """Fail jobs whose workers died on their last attempt; returns how many."""
+    now = timezone.now()
+    failed = SummaryJob.objects.filter(
+        status=SummaryJob.RUNNING, lease_expires_at__lt=now, attempts__gte=settings.SUMMARY_JOB_MAX_ATTEMPTS,
+    ).update(status=SummaryJob.FAILED, error="worker lost on the last attempt", finished_at=now)
+    if failed:
+        log.debug("summary_jobs.reap failed=%d", failed)
+    return failed
+
+
+def claim(job_id: int = None):
+    """Lease one claimable job to the caller; returns None if nothing was claimed.
+
+    The conditional UPDATE is what makes the claim exclusive, so two workers
+    racing for the same row can't both run it (SKIP LOCKED just spreads them out).
+    """
+    now = timezone.now()
+    qs = SummaryJob.objects.filter(_claimable(now))
+    if job_id is not None:
+        qs = qs.filter(id=job_id)
+    with transaction.atomic():
+        job = qs.select_for_update(skip_locked=True).order_by("created_at").first()
+        if job is None:
+            return None
+        # attempts goes up with every claim, so it doubles as the row's version
+        claimed = SummaryJob.objects.filter(id=job.id, status=job.status, attempts=job.attempts).update(
+            status=SummaryJob.RUNNING, started_at=now, attempts=job.attempts + 1,
+            lease_expires_at=now + timedelta(seconds=settings.SUMMARY_JOB_LEASE_SECONDS))
+    if not claimed:
+        return None
+    if job.status == SummaryJob.RUNNING:
+        log.debug("summary_jobs.reclaim job_id=%s attempt=%s", job.id, job.attempts + 1)
+    job.refresh_from_db()
+    return job
+
+
+def execute(job: SummaryJob) -> SummaryJob:
+    retry = False
+    try:
+        job.result = summaries.generate_summary(job.day_entry, job.payload, job.style)
+        job.status = SummaryJob.DONE
+    except Exception as e:
+        log.exception("summary_jobs.failed job_id=%s attempt=%s", job.id, job.attempts)
+        job.error = str(e)
+        retry = job.attempts < settings.SUMMARY_JOB_MAX_ATTEMPTS
+        job.status = SummaryJob.PENDING if retry else SummaryJob.FAILED
+    job.lease_expires_at = None
+    job.finished_at = None if retry else timezone.now()
+    job.save(update_fields=["result", "error", "status", "lease_expires_at", "finished_at"])
+    log.debug("summary_jobs.finish job_id=%s status=%s", job.id, job.status)
+    if retry:
+        _dispatch(job.id)
+    return job
+
+
+def run_job(job_id: int):
+    job = claim(job_id)
+    if job is None:  # already taken by another worker
+        return None
+    return execute(job)
+
+
+def nudge(job: SummaryJob):
+    """Hand a job no live worker holds to this process's pool (thread backend only).
+
+    That is a job queued before this process started, whose pool died with
+    the old one, or a running job whose lease ran out.
+    """
+    if settings.SUMMARY_QUEUE_BACKEND != "thread":
+        return
+    lost = job.status == SummaryJob.RUNNING and job.lease_expires_at and job.lease_expires_at < timezone.now()
+    if lost:
+        reap()  # out of attempts: nothing left to run
+    if lost or job.status == SummaryJob.PENDING and job.created_at < _process_started:
+        log.debug("summary_jobs.nudge job_id=%s status=%s", job.id, job.status)
+        _dispatch(job.id)
@@ -0,0 +1,32 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import uploads
+from api.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete expired resumable uploads and any .part files no session owns."
+
+    def handle(self, *args, **opts):
+        expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+        count = 0
+        for session in expired.iterator():
+            uploads.discard(session)
+            count += 1
+
+        # .part files left behind by a crash between file and row changes
+        orphans = 0
+        if os.path.isdir(settings.CHUNKED_UPLOAD_DIR):
+            live = {f"{pk}.part" for pk in UploadSession.objects.values_list("id", flat=True)}
+            cutoff = time.time() - settings.CHUNKED_UPLOAD_TTL_HOURS * 3600
+            for name in os.listdir(settings.CHUNKED_UPLOAD_DIR):
+                path = os.path.join(settings.CHUNKED_UPLOAD_DIR, name)
+                if name not in live and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    orphans += 1
+        self.stdout.write(f"Removed {count} expired upload sessions and {orphans} orphaned partial files")
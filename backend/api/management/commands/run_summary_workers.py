@@ -0,0 +1,50 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = "Drain queued SummaryJob rows with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.SUMMARY_WORKERS)
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty instead of polling forever.")
+
+    def handle(self, *args, **opts):
+        stop = threading.Event()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    job = jobs.claim()
+                    if job is not None:
+                        jobs.execute(job)
+                    elif jobs.reap():
+                        continue
+                    elif opts["once"]:
+                        return
+                    else:
+                        stop.wait(opts["poll_interval"])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, name=f"summary-worker-{i}", daemon=True)
+                   for i in range(opts["workers"])]
+        for t in threads:
+            t.start()
+        self.stdout.write(f"Started {len(threads)} summary workers")
+        try:
+            while any(t.is_alive() for t in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for t in threads:
+                t.join()
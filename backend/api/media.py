@@ -0,0 +1,172 @@
+# api/media.py
+# Serving media from local storage (remote storages hand out their own
+# presigned URLs). Access is checked per request: either the URL carries a
+# signature minted for someone who passed the ownership check (what the API
+# serializers return, so <img src> and the Gemini service need no token), or
+# the request is authenticated as the owning account.
+#
+# The bytes themselves go out via the front web server when MEDIA_SENDFILE is
+# set (nginx X-Accel-Redirect, Apache/lighttpd X-Sendfile); otherwise Django
+# streams them with Range support. Either way responses carry an ETag, and
+# content-addressed names (sha256 stems) are cached as immutable.
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import Attachment, Profile
+
+SALT = "api.media"
+READ_SIZE = 64 * 1024
+HASHED_NAME_RE = re.compile(r"(^|/)[0-9a-f]{64}[^/]*$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, max-age=3600"
+
+_signer = signing.Signer(salt=SALT)
+
+
+def _remote(storage) -> bool:
+    return bool(getattr(storage, "bucket_name", None))
+
+
+def url_window() -> int:
+    """Current signing window; every URL file_url() mints changes when it does.
+
+    Responses that embed signed URLs fold this into their validators, so a
+    client revalidating a cached body never keeps URLs that have expired.
+    """
+    return int(time.time()) // settings.MEDIA_URL_TTL
+
+
+def file_url(f) -> str:
+    """URL the API hands out for a stored file."""
+    if _remote(f.storage):
+        return f.url  # S3Storage.url() presigns (AWS_QUERYSTRING_AUTH)
+    # Expiry is rounded to the window so URLs (and browser caches) stay stable
+    expires = (url_window() + 2) * settings.MEDIA_URL_TTL
+    query = urlencode({"e": expires, "s": _signer.signature(f"{f.name}:{expires}")})
+    return f"{settings.MEDIA_URL}{quote(f.name)}?{query}"
+
+
+def _signature_ok(name: str, params) -> bool:
+    try:
+        expires = int(params.get("e", ""))
+    except ValueError:
+        return False
+    expected = _signer.signature(f"{name}:{expires}")
+    return expires > time.time() and signing.constant_time_compare(expected, params.get("s", ""))
+
+
+def _owner_ok(request, name: str) -> bool:
+    user = request.user if request.user.is_authenticated else None
+    if user is None:
+        try:
+            auth = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            auth = None
+        user = auth[0] if auth else None
+    if user is None:
+        return False
+    if user.is_staff:
+        return True
+    return (Attachment.objects.filter(Q(file=name) | Q(thumbnail=name) | Q(model_input=name),
+                                      owner_profile__owner=user).exists()
+            or Profile.objects.filter(avatar=name, owner=user).exists())
+
+
+def _cache_control(name: str) -> str:
+    return IMMUTABLE if HASHED_NAME_RE.search(name) else REVALIDATE
+
+
+def _content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _byte_range(header: str, size: int):
+    """(start, end) for a single satisfiable range, None to send everything, or "unsatisfiable"."""
+    m = RANGE_RE.match(header or "")
+    if not m:
+        return None  # absent, malformed or multi-range: a full 200 is always allowed
+    first, last = m.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+@require_safe
+def serve(request, path: str):
+    if _remote(default_storage):
+        raise Http404  # remote storages serve their own URLs
+    # Access first, and the same 404 either way: a 403 for files that exist
+    # would let anyone probe for a known photo by its content-hash name
+    if not _signature_ok(path, request.GET) and not _owner_ok(request, path):
+        raise Http404
+    try:
+        full = default_storage.path(path)
+        st = os.stat(full)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {"ETag": etag, "Cache-Control": _cache_control(path),
+               "Last-Modified": http_date(st.st_mtime), "Accept-Ranges": "bytes"}
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if not_modified is not None:
+        for k, v in headers.items():
+            not_modified[k] = v
+        return not_modified
+
+    if settings.MEDIA_SENDFILE:
+        # The web server handles ranges and does the copy; no file bytes pass through Python
+        response = HttpResponse(content_type=_content_type(path), headers=headers)
+        if settings.MEDIA_SENDFILE == "nginx":
+            response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        else:
+            response["X-Sendfile"] = full
+        return response
+
+    byte_range = None
+    if request.method == "GET" and request.headers.get("If-Range", etag) == etag:
+        byte_range = _byte_range(request.headers.get("Range"), st.st_size)
+    if byte_range == "unsatisfiable":
+        return HttpResponse(status=416, headers={"Content-Range": f"bytes */{st.st_size}", **headers})
+    if byte_range is None:
+        # FileResponse uses wsgi.file_wrapper, i.e. sendfile() under gunicorn
+        return FileResponse(open(full, "rb"), headers=headers)
+    start, end = byte_range
+    response = StreamingHttpResponse(_read_range(full, start, end - start + 1), status=206,
+                                     content_type=_content_type(path), headers=headers)
+    response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    response["Content-Length"] = str(end - start + 1)
+    return response
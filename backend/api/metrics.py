@@ -0,0 +1,238 @@
+# api/metrics.py
+# Per-request instrumentation. RequestMetricsMiddleware times every request
+# and splits the time into stages: ORM queries (a connection execute_wrapper),
+# outbound HTTP (api/outbound.py), storage writes and response rendering. The
+# split goes back to the client as a Server-Timing header (browser devtools
+# show it next to the request) and into process-wide counters that /metrics
+# serves in the Prometheus text format.
+#
+# Each request also carries a correlation id: the client's X-Request-ID when it
+# sends a sane one, a fresh one otherwise. It is echoed on the response, added
+# to log records (RequestIdFilter), forwarded to the Gemini service and kept by
+# background work the request queues, so one summary can be followed across
+# both services' logs.
+#
+# Counters are per process; under gunicorn every worker exposes its own series,
+# labelled with its pid, and sum() across them gives the service totals.
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+
+log = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_request_id = contextvars.ContextVar("request_id", default="")
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(lambda: [0, 0.0])  # stage -> [calls, seconds]
+
+    def add(self, stage: str, seconds: float):
+        calls_seconds = self.stages[stage]
+        calls_seconds[0] += 1
+        calls_seconds[1] += seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"total;dur={total * 1000:.1f}"]
+        for stage, (calls, seconds) in self.stages.items():
+            parts.append(f'{stage};dur={seconds * 1000:.1f};desc="{calls} call{"s" if calls != 1 else ""}"')
+        return ", ".join(parts)
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+@contextmanager
+def bound_request_id(request_id: str):
+    """Run a block (e.g. background work) under a request's correlation id."""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """Count the block towards ``stage`` of the current request; no-op outside one."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - started)
+
+
+def _db_timer(timings: RequestTimings):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.add("db", time.perf_counter() - started)
+    return wrapper
+
+
+# ---- Registry ----
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))  # labels -> per-bucket, last is +Inf
+        self.sums = Counter()
+
+    def observe(self, labels: tuple, value: float):
+        counts = self.counts[labels]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[labels] += value
+
+    def render(self, label_names: tuple, pid: int) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.counts.items()):
+            named = dict(zip(label_names, labels), pid=pid)
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(**named, le=bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(**named)} {self.sums[labels]:.6f}")
+            lines.append(f"{self.name}_count{_labels(**named)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (view, method, status)
+        self.durations = Histogram("http_request_duration_seconds",
+                                   "Time until the response was handed to the server.", DURATION_BUCKETS)
+        self.queries = Histogram("db_queries_per_request", "ORM queries run per request.", QUERY_BUCKETS)
+        self.stage_calls = Counter()  # (view, stage)
+        self.stage_seconds = Counter()
+
+    def observe(self, view: str, method: str, status: int, total: float, timings: RequestTimings):
+        with self._lock:
+            self.requests[(view, method, str(status))] += 1
+            self.durations.observe((view, method), total)
+            self.queries.observe((view,), timings.stages["db"][0] if "db" in timings.stages else 0)
+            for stage, (calls, seconds) in timings.stages.items():
+                self.stage_calls[(view, stage)] += calls
+                self.stage_seconds[(view, stage)] += seconds
+
+    def render(self) -> str:
+        pid = os.getpid()
+        with self._lock:
+            lines = ["# HELP http_requests_total Requests handled.", "# TYPE http_requests_total counter"]
+            lines += [f"http_requests_total{_labels(view=v, method=m, status=s, pid=pid)} {n}"
+                      for (v, m, s), n in sorted(self.requests.items())]
+            lines += self.durations.render(("view", "method"), pid)
+            lines += self.queries.render(("view",), pid)
+            lines += ["# HELP request_stage_seconds_total Time spent per stage (db, http, storage, render).",
+                      "# TYPE request_stage_seconds_total counter"]
+            lines += [f"request_stage_seconds_total{_labels(view=v, stage=s, pid=pid)} {sec:.6f}"
+                      for (v, s), sec in sorted(self.stage_seconds.items())]
+            lines += ["# HELP request_stage_calls_total Calls per stage (queries, outbound requests, ...).",
+                      "# TYPE request_stage_calls_total counter"]
+            lines += [f"request_stage_calls_total{_labels(view=v, stage=s, pid=pid)} {n}"
+                      for (v, s), n in sorted(self.stage_calls.items())]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ---- Middleware, logging and the /metrics view ----
+class RequestMetricsMiddleware:
+    """Outermost middleware, so its numbers cover the rest of the stack.
+
+    Streaming responses are timed up to the first byte; what the body
+    generator does afterwards isn't counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        timings = RequestTimings()
+        id_token, timings_token = _request_id.set(request_id), _timings.set(timings)
+        try:
+            with connection.execute_wrapper(_db_timer(timings)):
+                response = self.get_response(request)
+        finally:
+            _timings.reset(timings_token)
+        try:
+            total = time.perf_counter() - timings.started
+            match = getattr(request, "resolver_match", None)
+            view = (match.view_name if match else "") or "unmatched"
+            registry.observe(view, request.method, response.status_code, total, timings)
+            response[REQUEST_ID_HEADER] = request_id
+            if settings.SERVER_TIMING:
+                response["Server-Timing"] = timings.server_timing(total)
+            log.debug("request.timing view=%s status=%s ms=%.1f %s", view, response.status_code,
+                      total * 1000, " ".join(f"{s}={c}/{sec * 1000:.1f}ms" for s, (c, sec) in timings.stages.items()))
+        finally:
+            _request_id.reset(id_token)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that separately
+        timings = _timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda r: timings.add("render", time.perf_counter() - started))
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` to every record ("-" outside a request)."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+@require_safe
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
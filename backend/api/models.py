@@ -1,6 +1,11 @@
 # api/models.py
+import hashlib
+import os
+import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db.models import Q
 from django.conf import settings
 
@@ -49,8 +54,18 @@ class DayEntry(models.Model):
     date = models.DateField()  # one per day per profile
     note = models.TextField(blank=True)
     summary_text = models.TextField(blank=True)
+    # Fingerprint of the note and photos summary_text was written from; recaps
+    # regenerate a day's summary when it no longer matches (see api/recaps.py)
+    summary_source = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept current by Postgres on every write; note hits rank above summary hits
+    search_vector = models.GeneratedField(
+        expression=SearchVector("note", weight="A", config="english")
+        + SearchVector("summary_text", weight="B", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         constraints = [
@@ -58,14 +73,164 @@ class DayEntry(models.Model):
         ]
         indexes = [
             models.Index(fields=["profile", "date"]),
+            GinIndex(fields=["search_vector"], name="dayentry_search_idx"),
         ]
 
     def __str__(self): return f"{self.profile} {self.date}"
 
 
+# One stored copy per distinct file content; Attachment rows share it and
+# ref_count tracks how many do (see api/blobs.py). Derivatives are built once
+# per blob and copied onto every attachment that references it.
+class Blob(models.Model):
+    content_hash = models.CharField(max_length=64, unique=True)  # sha256; also the stored file's name
+    file = models.FileField(upload_to="attachments/")
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    model_input = models.FileField(upload_to="attachments/derived/", null=True, blank=True)
+    thumbnail = models.FileField(upload_to="attachments/derived/", null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self): return f"{self.content_hash[:12]} x{self.ref_count}"
+
+
 # Reuse Attachment; link it to profile/entry
 class Attachment(models.Model):
     file = models.FileField(upload_to="attachments/")
     created_at = models.DateTimeField(auto_now_add=True)
     owner_profile = models.ForeignKey(Profile, null=True, blank=True, on_delete=models.SET_NULL, related_name="attachments")
     day_entry = models.ForeignKey(DayEntry, null=True, blank=True, on_delete=models.CASCADE, related_name="attachments")
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)  # sha256 of the file bytes
+    # Derivatives built after upload by api/derivatives.py; empty until then (or for non-images)
+    model_input = models.FileField(upload_to="attachments/derived/", null=True, blank=True)  # small JPEG sent to Gemini
+    thumbnail = models.FileField(upload_to="attachments/derived/", null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # Shared stored content; file/model_input/thumbnail above mirror the blob's.
+    # Null for rows uploaded before deduplication, which own their files.
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name="attachments")
+    # The direct upload (its storage key, see api/direct.py) or resumable upload
+    # session (uploads.upload_key) this row was completed from; unique, so a
+    # retried, replayed or concurrent complete finds this row instead of adding another
+    upload_key = models.CharField(max_length=255, null=True, blank=True, unique=True, editable=False)
+
+    def compute_content_hash(self) -> str:
+        h = hashlib.sha256()
+        for chunk in self.file.chunks():
+            h.update(chunk)
+        return h.hexdigest()
+
+    def ensure_content_hash(self) -> str:
+        # Rows from before content_hash existed get hashed (and saved) on first use
+        if not self.content_hash and self.file:
+            self.content_hash = self.compute_content_hash()
+            if self.pk:
+                Attachment.objects.filter(pk=self.pk).update(content_hash=self.content_hash)
+        return self.content_hash
+
+    def save(self, *args, **kwargs):
+        if not self.content_hash and self.file:
+            self.content_hash = self.compute_content_hash()
+        super().save(*args, **kwargs)
+
+
+# Queued summary generation; drained by the worker pool in api/jobs.py
+class SummaryJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    day_entry = models.ForeignKey(DayEntry, on_delete=models.CASCADE, related_name="summary_jobs")
+    style = models.CharField(max_length=20, default="short")
+    payload = models.JSONField(default=dict)  # note/photo_count/image_urls snapshot sent to the microservice
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # A running job whose lease ran out lost its worker; the next claim takes it over
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self): return f"{self.day_entry} {self.style} [{self.status}]"
+
+
+# A weekly or monthly story reduced from shorter summaries: a week from its
+# days' summary_text, a month from its weeks (cut at the month's edges). Each
+# row remembers a fingerprint of what it was built from, so only levels whose
+# inputs changed are regenerated (see api/recaps.py).
+class Recap(models.Model):
+    WEEK = "week"
+    MONTH = "month"
+    PERIOD_CHOICES = [(WEEK, "Week"), (MONTH, "Month")]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="recaps")
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    start = models.DateField()
+    end = models.DateField()  # inclusive
+    style = models.CharField(max_length=20, default="short")
+    text = models.TextField()
+    source_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["profile", "period", "start", "end", "style"], name="uniq_recap")
+        ]
+        indexes = [
+            models.Index(fields=["profile", "start"]),
+        ]
+
+    def __str__(self): return f"{self.profile} {self.period} {self.start}..{self.end} {self.style}"
+
+
+# A resumable upload in progress; bytes land in a .part file until it's finalized
+# into an Attachment (see api/uploads.py). Expired sessions are removed by
+# `manage.py cleanup_upload_sessions`.
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day_entry = models.ForeignKey(DayEntry, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    @property
+    def partial_path(self) -> str:
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{self.id}.part")
+
+    def __str__(self): return f"{self.day_entry} {self.filename} {self.received}/{self.size}"
+
+
+# A summary call in flight, or just landed, that concurrent requests for the
+# same content share instead of repeating (see api/flights.py). While value is
+# null the row is the leader's lease; expired rows are swept by the next lease.
+class Flight(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    token = models.CharField(max_length=32)
+    value = models.JSONField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self): return f"{self.key} ({'landed' if self.value is not None else 'in flight'})"
@@ -0,0 +1,76 @@
+# api/outbound.py
+# One pooled, keep-alive requests.Session per process for every outbound
+# HTTP call (currently the Gemini microservice). Use get_session() instead
+# of module-level requests.get/post so connections are reused and every call
+# gets the configured connect/read timeouts and retry policy. Calls are timed
+# into the current request's "http" stage and carry its X-Request-ID.
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class _TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (settings.OUTBOUND_CONNECT_TIMEOUT, settings.OUTBOUND_READ_TIMEOUT))
+        request_id = metrics.current_request_id()
+        if request_id:
+            kwargs["headers"] = {metrics.REQUEST_ID_HEADER: request_id, **(kwargs.get("headers") or {})}
+        with metrics.timed("http"):  # up to the response headers for stream=True
+            return super().request(method, url, **kwargs)
+
+
+class _Retry(Retry):
+    """Retries 502/504 only for idempotent methods.
+
+    A gateway error can come after the upstream already started the model
+    call, so resending a POST could pay for the same generation twice. A 503
+    is the service turning the request away before any work (its queue is
+    full), so every method retries that one.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code != 503 and method.upper() not in Retry.DEFAULT_ALLOWED_METHODS:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _build_session() -> requests.Session:
+    retry = _Retry(
+        total=settings.OUTBOUND_RETRIES,
+        connect=settings.OUTBOUND_RETRIES,
+        read=0,  # the server may already be working on it; don't send it twice
+        status=settings.OUTBOUND_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=None,  # a connect error means nothing was sent; _Retry narrows the statuses
+        backoff_factor=settings.OUTBOUND_BACKOFF,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.OUTBOUND_POOL_SIZE, max_retries=retry)
+    session = _TimeoutSession()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session, _session_pid
+    with _session_lock:
+        # A forked worker must not share the parent's sockets
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def gemini_url(path: str) -> str:
+    return settings.GEMINI_SERVICE_URL.rstrip("/") + path
@@ -0,0 +1,175 @@
+# api/recaps.py
+# Weekly and monthly recaps, built map-reduce style from summaries that already
+# exist instead of one huge prompt over every note and photo in the range:
+#
+#   days   -> DayEntry.summary_text, queued as summary jobs where missing or stale
+#   weeks  -> Recap(period="week"), reduced from up to seven day summaries
+#   months -> Recap(period="month"), reduced from its weeks (cut at the month's edges)
+#
+# Each Recap stores a fingerprint of the texts it was reduced from, and a level
+# goes back to the model only when that changed. Editing one day costs that
+# day, its week and its month; asking again for an unchanged range costs
+# nothing but three queries.
+#
+# Days never go to the model inside the request: a month can have 31 stale
+# ones. They go through api/jobs.py instead, and until they land the recap is
+# provisional - stitched from what's already there, with no reduce calls and
+# nothing stored - and the caller asks again (RecapView answers 202).
+import calendar
+import hashlib
+import logging
+from collections import Counter
+from datetime import timedelta
+
+import requests
+
+from .circuit import CircuitOpenError
+from .models import DayEntry, Recap, SummaryJob
+from . import jobs, outbound, summaries, summary_cache
+
+log = logging.getLogger(__name__)
+
+FALLBACK_CHARS = 600
+
+
+def week_bounds(day):
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def month_bounds(day):
+    return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _week_segments(start, end) -> list:
+    """Monday-to-Sunday weeks covering start..end, the first and last cut to fit."""
+    segments = []
+    while start <= end:
+        segment_end = min(week_bounds(start)[1], end)
+        segments.append((start, segment_end))
+        start = segment_end + timedelta(days=1)
+    return segments
+
+
+def _range_label(start, end) -> str:
+    if start == end:
+        return start.strftime("%a %d %b")
+    return f"{start.strftime('%d %b')} - {end.strftime('%d %b')}"
+
+
+def _fingerprint(style: str, parts: list) -> str:
+    h = hashlib.sha256(style.encode("utf-8"))
+    for part in parts:
+        h.update(b"\0" + part["label"].encode("utf-8") + b"\0" + part["text"].encode("utf-8"))
+    return h.hexdigest()
+
+
+def _fallback(parts: list) -> str:
+    text = " ".join(part["text"] for part in parts)
+    return (text[:FALLBACK_CHARS] + "…") if len(text) > FALLBACK_CHARS else text
+
+
+def request_recap(period: str, style: str, parts: list) -> str:
+    """Call the FastAPI Gemini service; raises requests exceptions on failure."""
+    response = outbound.get_session().post(outbound.gemini_url("/generate-recap"),
+                                           json={"period": period, "style": style, "parts": parts})
+    response.raise_for_status()
+    return response.json().get("summary", "")
+
+
+class _Builder:
+    """Loads the range's entries and stored recaps once, then fills in what's missing."""
+
+    def __init__(self, request, profile_id: int, style: str, start, end):
+        self.request = request
+        self.profile_id = profile_id
+        self.style = style
+        self.entries = list(DayEntry.objects.filter(profile_id=profile_id, date__range=(start, end))
+                            .prefetch_related("attachments").order_by("date"))
+        self.recaps = {(r.period, r.start, r.end): r for r in
+                       Recap.objects.filter(profile_id=profile_id, style=style, start__gte=start, end__lte=end)}
+        self.jobs = {j.day_entry_id: j for j in SummaryJob.objects.filter(
+            day_entry__in=self.entries, style=style, status__in=[SummaryJob.PENDING, SummaryJob.RUNNING])}
+        self.pending = []  # ids of the day jobs this recap is waiting on
+        self.regenerated = Counter()
+
+    def day(self, entry: DayEntry) -> str:
+        hashes = [att.ensure_content_hash() for att in entry.attachments.all()]
+        if not entry.note.strip() and not hashes:
+            return entry.summary_text
+        if entry.summary_text and entry.summary_source == summary_cache.source_key(entry.note, hashes):
+            return entry.summary_text
+        job = self.jobs.get(entry.id)
+        if job is None:
+            job = jobs.enqueue(entry, summaries.build_payload(entry, self.request), self.style)
+            self.regenerated["days"] += 1
+        else:
+            jobs.nudge(job)  # queued by an earlier ask; its worker may have gone away
+        self.pending.append(job.id)
+        return entry.summary_text or entry.note.strip()  # stands in until the job lands
+
+    def reduce(self, period: str, start, end, parts: list, provisional: bool = False) -> str:
+        key = (period, start, end)
+        if not parts:
+            if key in self.recaps:  # everything in it was deleted
+                self.recaps.pop(key).delete()
+            return ""
+        if provisional:  # some days are still queued; reducing now would be thrown away
+            return _fallback(parts)
+        fingerprint = _fingerprint(self.style, parts)
+        if key in self.recaps and self.recaps[key].source_hash == fingerprint:
+            return self.recaps[key].text
+        try:
+            with summaries.service_breaker.call():
+                text = request_recap(period, self.style, parts)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            log.error(f"Error calling Gemini service for a recap: {str(e)}")
+            return _fallback(parts)  # not stored; the next request tries the service again
+        self.recaps[key], _ = Recap.objects.update_or_create(
+            profile_id=self.profile_id, period=period, start=start, end=end, style=self.style,
+            defaults={"text": text, "source_hash": fingerprint})
+        self.regenerated[f"{period}s"] += 1
+        return text
+
+    def week(self, start, end) -> str:
+        waiting = len(self.pending)
+        parts = []
+        for entry in self.entries:
+            if start <= entry.date <= end:
+                text = self.day(entry)
+                if text:
+                    parts.append({"label": _range_label(entry.date, entry.date), "text": text})
+        return self.reduce(Recap.WEEK, start, end, parts, provisional=len(self.pending) > waiting)
+
+    def month(self, start, end):
+        weeks = [(s, e, self.week(s, e)) for s, e in _week_segments(start, end)]
+        parts = [{"label": _range_label(s, e), "text": text} for s, e, text in weeks if text]
+        return self.reduce(Recap.MONTH, start, end, parts, provisional=bool(self.pending)), weeks
+
+
+def build(request, profile_id: int, period: str, day, style: str) -> dict:
+    """The recap of the week or month containing ``day``, regenerating only what changed.
+
+    ``pending_jobs`` lists the day summaries still queued; while it's non-empty
+    the recap is provisional and asking again later gets the real one.
+    """
+    if period == Recap.WEEK:
+        start, end = week_bounds(day)
+        builder = _Builder(request, profile_id, style, start, end)
+        text, weeks = builder.week(start, end), []
+    else:
+        start, end = month_bounds(day)
+        builder = _Builder(request, profile_id, style, start, end)
+        text, weeks = builder.month(start, end)
+    log.debug("recaps.build profile_id=%s period=%s start=%s regenerated=%s",
+              profile_id, period, start, dict(builder.regenerated))
+    return {
+        "period": period,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "style": style,
+        "recap": text,
+        "weeks": [{"start": s.isoformat(), "end": e.isoformat(), "recap": t} for s, e, t in weeks],
+        "pending_jobs": builder.pending,
+        "regenerated": {level: builder.regenerated[level] for level in ("days", "weeks", "months")},
+    }
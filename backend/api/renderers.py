@@ -0,0 +1,19 @@
+# api/renderers.py
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(data: dict, event: str = "message") -> str:
+    head = f"event: {event}\n" if event != "message" else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views negotiate text/event-stream; errors go out as a single "error" event."""
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event(data, event="error").encode(self.charset)
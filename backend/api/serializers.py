@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Profile, DayEntry, Attachment
+from django.conf import settings
+from django.utils import timezone
+from .models import Profile, DayEntry, Attachment, Recap, SummaryJob, UploadSession
+from . import media
 
 User = get_user_model()
 
@@ -36,25 +39,33 @@ class ProfileSerializer(serializers.ModelSerializer):
         if obj.avatar:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
+                return request.build_absolute_uri(media.file_url(obj.avatar))
+            return media.file_url(obj.avatar)
         return None
 
 class AttachmentSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Attachment
-        fields = ["id", "url", "created_at"]
+        fields = ["id", "url", "thumbnail_url", "width", "height", "created_at"]
     
-    def get_url(self, obj):
-        if obj.file:
+    def _absolute(self, f):
+        if f:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
+                return request.build_absolute_uri(media.file_url(f))
+            return media.file_url(f)
         return None
 
+    def get_url(self, obj):
+        return self._absolute(obj.file)
+
+    def get_thumbnail_url(self, obj):
+        # Falls back to the original until the derivative has been built
+        return self._absolute(obj.thumbnail or obj.file)
+
 class DayEntrySerializer(serializers.ModelSerializer):
     attachments = AttachmentSerializer(many=True, read_only=True)
     
@@ -67,4 +78,39 @@ class UpsertDayEntrySerializer(serializers.Serializer):
     note = serializers.CharField(required=False, allow_blank=True)
 
 class GenerateSummarySerializer(serializers.Serializer):
-    style = serializers.ChoiceField(choices=["short", "cheerful", "nostalgic"], required=False, default="short")
\ No newline at end of file
+    style = serializers.ChoiceField(choices=["short", "cheerful", "nostalgic"], required=False, default="short")
+    mode = serializers.ChoiceField(choices=["sync", "async"], required=False, default="sync")
+
+class RecapRequestSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=Recap.PERIOD_CHOICES, required=False, default=Recap.WEEK)
+    date = serializers.DateField(required=False, default=timezone.localdate)  # any day in the week/month
+    style = serializers.ChoiceField(choices=["short", "cheerful", "nostalgic"], required=False, default="short")
+
+class SummaryJobSerializer(serializers.ModelSerializer):
+    summary = serializers.CharField(source="result", read_only=True)
+
+    class Meta:
+        model = SummaryJob
+        fields = ["id", "day_entry", "style", "status", "summary", "error", "created_at", "finished_at"]
+
+class CreateUploadSessionSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_size(self, value):
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"at most {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes")
+        return value
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source="received", read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "offset", "expires_at"]
+
+class DirectUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False, default="application/octet-stream")
+    size = serializers.IntegerField(min_value=1, max_value=settings.CHUNKED_UPLOAD_MAX_SIZE)
+    sha256 = serializers.RegexField(r"^[0-9a-f]{64}$")
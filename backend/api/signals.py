@@ -0,0 +1,21 @@
+# api/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Profile, Attachment
+from . import blobs, caching
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def _profile_changed(sender, instance, **kwargs):
+    # Creates, deletes, avatar changes and is_default flips all go through save()/delete().
+    # Again after commit, in case a concurrent read re-cached the old rows meanwhile.
+    caching.invalidate_profiles(instance.owner_id)
+    transaction.on_commit(lambda: caching.invalidate_profiles(instance.owner_id))
+
+
+@receiver(post_delete, sender=Attachment)
+def _release_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        blobs.release(instance.blob_id)
@@ -0,0 +1,225 @@
+# api/summaries.py
+# Summary generation shared by GenerateSummaryView and the job workers.
+import json
+import logging
+import time
+import requests
+from django.conf import settings
+
+from .circuit import CircuitBreaker, CircuitOpenError
+from . import flights, media, outbound, summary_cache
+
+log = logging.getLogger(__name__)
+
+OPENERS = {"short": "Today's moments:", "cheerful": "What a lovely day!", "nostalgic": "Another day to remember."}
+CLOSINGS = {"short": "Feeling grateful.", "cheerful": "Hope this brings a smile 😊", "nostalgic": "Thinking of the good old times."}
+
+# While open, summaries fall back immediately instead of waiting on timeouts
+service_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=settings.SUMMARY_BREAKER_FAILURES,
+    slow_call_seconds=settings.SUMMARY_BREAKER_SLOW_CALL_SECONDS,
+    reset_seconds=settings.SUMMARY_BREAKER_RESET_SECONDS,
+)
+
+
+def _is_local(field_file) -> bool:
+    try:
+        field_file.path
+    except NotImplementedError:  # remote storages (S3 etc.) have no filesystem path
+        return False
+    return True
+
+
+def build_payload(entry, request) -> dict:
+    """Snapshot of what the microservice needs; safe to store on a SummaryJob.
+
+    With SUMMARY_IMAGE_TRANSPORT="path" local files go over as storage keys the
+    microservice reads straight from its MEDIA_ROOT, instead of URLs it would
+    download back through Django's media route.
+    """
+    attachments = list(entry.attachments.all())
+    image_urls, image_paths = [], []
+    for att in attachments:
+        source = att.model_input or att.file  # pre-shrunk derivative when it's ready
+        if settings.SUMMARY_IMAGE_TRANSPORT == "path" and _is_local(source):
+            image_paths.append(source.name)
+        else:
+            # Get image URLs for Gemini to analyze
+            image_urls.append(request.build_absolute_uri(media.file_url(source)))
+    return {
+        "note": (entry.note or "").strip(),
+        "photo_count": len(attachments),
+        "image_urls": image_urls,
+        "image_paths": image_paths,
+        # Only used for the cache key, not sent to the microservice
+        "attachment_hashes": [att.ensure_content_hash() for att in attachments],
+    }
+
+
+def fallback_summary(payload: dict, style: str) -> str:
+    """Hand-built summary used when the AI service is unavailable."""
+    note = payload.get("note", "")
+    photo_count = payload.get("photo_count", 0)
+    parts = []
+    if photo_count:
+        parts.append(f"I snapped {photo_count} photo{'s' if photo_count != 1 else ''}.")
+    if note:
+        parts.append((note[:220] + "…") if len(note) > 220 else note)
+    return f"{OPENERS[style]} " + " ".join(parts) + f" {CLOSINGS[style]}"
+
+
+def _service_body(payload: dict, style: str) -> dict:
+    body = {k: payload[k] for k in ("note", "photo_count", "image_urls")}
+    body["image_paths"] = payload.get("image_paths", [])  # absent on jobs queued before path transport
+    return {**body, "style": style}
+
+
+def request_summary(payload: dict, style: str) -> str:
+    """Call the FastAPI Gemini service; raises requests exceptions on failure."""
+    response = outbound.get_session().post(outbound.gemini_url("/generate-summary"),
+                                           json=_service_body(payload, style))
+    response.raise_for_status()
+    return response.json().get("summary", "")
+
+
+def _iter_service_events(payload: dict, style: str):
+    """Yield (event, data) pairs from the microservice's SSE stream."""
+    url = outbound.gemini_url("/generate-summary/stream")
+    with outbound.get_session().post(url, json=_service_body(payload, style), stream=True) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message"
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+
+
+def _save(entry, summary: str, payload: dict, generated: bool):
+    # Fallbacks get no source, so recaps ask the service again (see api/recaps.py)
+    entry.summary_text = summary
+    entry.summary_source = (summary_cache.source_key(payload["note"], payload.get("attachment_hashes", []))
+                            if generated else "")
+    entry.save(update_fields=["summary_text", "summary_source", "updated_at"])
+
+
+def _call_service(payload: dict, style: str):
+    """The service's summary, or None when it failed or the breaker is open."""
+    try:
+        with service_breaker.call():
+            return request_summary(payload, style)
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        log.error(f"Error calling Gemini service: {str(e)}")
+        return None
+
+
+def _stream_from_service(payload: dict, style: str):
+    """Yield ("message", {"delta"}) as the service streams; returns the summary, or None on failure."""
+    summary = None
+    try:
+        service_breaker.before_call()
+    except CircuitOpenError as e:
+        log.error(f"Error streaming from Gemini service: {str(e)}")
+        return None
+    started = time.monotonic()
+    first_event_after = None  # streams are long by design; only time-to-first-event counts as slow
+    outcome = None
+    try:
+        for event, data in _iter_service_events(payload, style):
+            if first_event_after is None:
+                first_event_after = time.monotonic() - started
+            if event == "message":
+                yield "message", {"delta": data.get("delta", "")}
+            elif event == "done":
+                summary = data.get("summary", "")
+            elif event == "error":
+                log.error(f"Gemini service stream failed: {data.get('detail')}")
+                break
+        outcome = "ok" if summary is not None else "failed"
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.error(f"Error streaming from Gemini service: {str(e)}")
+        outcome = "failed"
+    finally:
+        if outcome == "ok":
+            service_breaker.record_success(first_event_after or 0.0)
+        elif outcome == "failed":
+            service_breaker.record_failure()
+        else:  # client went away mid-stream; don't leave a half-open probe hanging
+            service_breaker.abandon()
+    return summary
+
+
+def _join_flight(key: str, entry):
+    """Lease for generating ``key``, or the result of the request already generating it.
+
+    Concurrent requests for the same content and style (a double tap, a second
+    device, a queued job) share one model call instead of each paying for one.
+    """
+    lease, shared = flights.join(key, settings.SUMMARY_FLIGHT_LEASE_SECONDS)
+    if lease is None:
+        log.debug("summaries.coalesced key=%s entry_id=%s", key, entry.id)
+    return lease, shared
+
+
+def generate_summary(entry, payload: dict, style: str) -> str:
+    """Generate a summary for ``entry`` and persist it to ``summary_text``."""
+    key = summary_cache.make_key(payload["note"], payload.get("attachment_hashes", []), style)
+    summary = summary_cache.get(key)
+    generated = True
+    if summary is None:
+        lease, shared = _join_flight(key, entry)
+        if lease is None:
+            summary, generated = shared["summary"], shared["generated"]
+        else:
+            try:
+                summary = _call_service(payload, style)
+            except BaseException:
+                lease.release()
+                raise
+            if summary is not None:
+                summary_cache.set(key, summary)  # fallbacks aren't cached; the service may come back
+            else:
+                # Fallback to simple summary if AI service fails
+                summary, generated = fallback_summary(payload, style), False
+            lease.publish({"summary": summary, "generated": generated})
+
+    _save(entry, summary, payload, generated)
+    return summary
+
+
+def stream_summary(entry, payload: dict, style: str):
+    """Like generate_summary, but yields ("message", {"delta"}) as text arrives.
+
+    Always ends with ("done", {"summary"}) carrying the text that was saved;
+    clients should replace what they've shown with it (it's the fallback if
+    the service failed part-way). A request that joins another's generation
+    gets the finished text as a single delta.
+    """
+    key = summary_cache.make_key(payload["note"], payload.get("attachment_hashes", []), style)
+    summary = summary_cache.get(key)
+    generated = True
+    if summary is None:
+        lease, shared = _join_flight(key, entry)
+        if lease is None:
+            summary, generated = shared["summary"], shared["generated"]
+            yield "message", {"delta": summary}
+        else:
+            try:
+                summary = yield from _stream_from_service(payload, style)
+            except BaseException:  # including the client going away (GeneratorExit)
+                lease.release()
+                raise
+            if summary is not None:
+                summary_cache.set(key, summary)
+            else:
+                summary, generated = fallback_summary(payload, style), False
+            lease.publish({"summary": summary, "generated": generated})
+    else:
+        yield "message", {"delta": summary}
+
+    _save(entry, summary, payload, generated)
+    yield "done", {"summary": summary}
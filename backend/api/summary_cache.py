@@ -0,0 +1,67 @@
+# api/summary_cache.py
+# Content-addressed cache of generated summaries. The key only depends on what
+# the model would see (normalized note, attachment bytes, style), so re-opening
+# or double-clicking an unchanged day never reaches the Gemini service.
+# TTL and LRU eviction come from the "summaries" cache alias (see CACHES).
+import hashlib
+import logging
+import unicodedata
+
+from django.core.cache import caches
+
+log = logging.getLogger(__name__)
+
+HITS_KEY = "summary_cache:hits"
+MISSES_KEY = "summary_cache:misses"
+
+
+def _cache():
+    return caches["summaries"]
+
+
+def normalize_note(note: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", note or "").split())
+
+
+def _content_digest(note: str, attachment_hashes):
+    h = hashlib.sha256()
+    h.update(normalize_note(note).encode("utf-8"))
+    for content_hash in sorted(attachment_hashes):
+        h.update(b"\0" + content_hash.encode("ascii"))
+    return h
+
+
+def source_key(note: str, attachment_hashes) -> str:
+    """Fingerprint of what a day's summary is written from, whatever the style."""
+    return _content_digest(note, attachment_hashes).hexdigest()
+
+
+def make_key(note: str, attachment_hashes, style: str) -> str:
+    h = _content_digest(note, attachment_hashes)
+    h.update(b"\0style=" + style.encode("utf-8"))
+    return f"summary:{h.hexdigest()}"
+
+
+def _count(counter_key: str):
+    cache = _cache()
+    cache.add(counter_key, 0, timeout=None)
+    try:
+        cache.incr(counter_key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(counter_key, 1, timeout=None)
+
+
+def get(key: str):
+    summary = _cache().get(key)
+    _count(HITS_KEY if summary is not None else MISSES_KEY)
+    log.debug("summary_cache.%s key=%s", "hit" if summary is not None else "miss", key)
+    return summary
+
+
+def set(key: str, summary: str):
+    _cache().set(key, summary)
+
+
+def stats() -> dict:
+    counters = _cache().get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": counters.get(HITS_KEY, 0), "misses": counters.get(MISSES_KEY, 0)}
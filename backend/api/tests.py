@@ -1,3 +1,1072 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+import requests
+import urllib3
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from .models import CustomUser, Profile, DayEntry, Attachment, Blob, Flight, Recap, SummaryJob, UploadSession
+from .serializers import AttachmentSerializer
+from . import blobs, derivatives, flights, jobs, outbound, summary_cache, uploads
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTests(TestCase):
+    """Hot endpoints run a fixed number of queries, however many attachments an entry has."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        caches["summaries"].clear()  # summary tests must miss, whatever ran before
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Alice", is_default=True)
+        self.entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 1, 1), note="hello")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base = f"/api/profiles/{self.profile.id}/entries/"
+        self.client.get("/api/profiles/")  # warm the per-user profile cache, as any app open does
+
+    def add_attachments(self, n: int):
+        for i in range(n):
+            Attachment.objects.create(file=ContentFile(b"img-%d" % i, name=f"{i}.jpg"),
+                                      owner_profile=self.profile, day_entry=self.entry)
+
+    def count_queries(self, method: str, url: str, **kwargs) -> int:
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)  # the stream saves the summary when it ends
+        self.assertLess(response.status_code, 300, getattr(response, "content", b""))
+        return len(ctx.captured_queries)
+
+    def assert_flat(self, method: str, url: str, expected: int, make_kwargs=lambda: {}):
+        self.add_attachments(1)
+        few = self.count_queries(method, url, **make_kwargs())
+        self.add_attachments(9)
+        many = self.count_queries(method, url, **make_kwargs())
+        self.assertEqual(few, many, f"{method.upper()} {url} grows with attachments")
+        self.assertEqual(many, expected)
+
+    def test_profiles_list(self):
+        self.assert_flat("get", "/api/profiles/", 0)
+
+    def test_entry_get(self):
+        self.assert_flat("get", f"{self.base}?date=2025-01-01", 2)
+
+    def test_entry_post_note(self):
+        notes = iter(["first", "second"])
+        self.assert_flat("post", self.base, 3,
+                         lambda: {"data": {"date": "2025-01-01", "note": next(notes)}, "format": "json"})
+
+    def test_upload(self):
+        # New content each time; re-uploads skip storing the blob (see DedupTests)
+        uploads = iter(range(100))
+        self.assert_flat("post", f"{self.base}{self.entry.id}/upload/", 11,
+                         lambda: {"data": {"file": SimpleUploadedFile("x.jpg", b"bytes-%d" % next(uploads))},
+                                  "format": "multipart"})
+
+    def test_batch_upload(self):
+        batches = iter(range(100))
+        def make(n):
+            batch = next(batches)
+            return {"data": {"files": [SimpleUploadedFile(f"{i}.jpg", b"b%d-%d" % (batch, i)) for i in range(n)]},
+                    "format": "multipart"}
+        self.assert_flat("post", f"{self.base}{self.entry.id}/upload/batch/", 11, lambda: make(3))
+        # ...and the number of files in the batch doesn't matter either
+        self.assertEqual(self.count_queries("post", f"{self.base}{self.entry.id}/upload/batch/", **make(12)), 11)
+
+    def test_dates(self):
+        self.assert_flat("get", f"{self.base}dates/", 1)
+
+    def test_search(self):
+        self.assert_flat("get", f"{self.base}search/?q=hello", 1)
+
+    def test_calendar(self):
+        # New attachments change the version, so every call here misses the cache:
+        # the version aggregate, then the range
+        self.assert_flat("get", f"{self.base}calendar/?month=2025-01", 2)
+
+    # A cache miss leads a flight (api/flights.py): read, savepoint + sweep + lease, publish
+    @mock.patch("api.summaries.request_summary", return_value="A lovely day.")
+    def test_summary(self, _):
+        self.assert_flat("post", f"{self.base}{self.entry.id}/summary/", 9,
+                         lambda: {"data": {"style": "short"}, "format": "json"})
+
+    @mock.patch("api.summaries._iter_service_events",
+                side_effect=lambda payload, style: iter([("done", {"summary": "A lovely day."})]))
+    def test_summary_stream(self, _):
+        self.assert_flat("post", f"{self.base}{self.entry.id}/summary/stream/", 9,
+                         lambda: {"data": {"style": "short"}, "format": "json",
+                                  "HTTP_ACCEPT": "text/event-stream"})
+
+
+class EntryReadTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("bob", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Bob", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/entries/"
+
+    def test_get_missing_day_does_not_create_a_row(self):
+        response = self.client.get(self.url, {"date": "2025-02-03"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data["id"])
+        self.assertEqual(response.data["attachments"], [])
+        self.assertFalse(DayEntry.objects.exists())
+
+    def test_get_other_users_profile_is_404(self):
+        other = CustomUser.objects.create_user("eve", password="pw")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url, {"date": "2025-02-03"}).status_code, 404)
+
+    def test_unchanged_entry_is_304_until_it_changes(self):
+        self.client.post(self.url, {"date": "2025-02-03", "note": "one"}, format="json")
+        etag = self.client.get(self.url, {"date": "2025-02-03"})["ETag"]
+        cached = self.client.get(self.url, {"date": "2025-02-03"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        self.client.post(self.url, {"date": "2025-02-03", "note": "two"}, format="json")
+        fresh = self.client.get(self.url, {"date": "2025-02-03"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.data["note"], "two")
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT, DERIVATIVES_BACKEND="thread")
+    def test_built_derivatives_change_the_etag(self):
+        entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 2, 3))
+        img = BytesIO()
+        Image.new("RGB", (40, 30), "red").save(img, format="JPEG")
+        upload = self.client.post(f"{self.url}{entry.id}/upload/",
+                                  {"file": SimpleUploadedFile("a.jpg", img.getvalue())}, format="multipart")
+        etag = self.client.get(self.url, {"date": "2025-02-03"})["ETag"]
+
+        derivatives.build_derivatives(upload.data["attachment"]["id"])  # what the background worker runs
+        fresh = self.client.get(self.url, {"date": "2025-02-03"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertIn("/derived/", fresh.data["attachments"][0]["thumbnail_url"])
+
+    def test_etag_moves_with_the_url_signing_window(self):
+        self.client.post(self.url, {"date": "2025-02-03", "note": "one"}, format="json")
+        with mock.patch("api.media.url_window", return_value=100):
+            etag = self.client.get(self.url, {"date": "2025-02-03"})["ETag"]
+            cached = self.client.get(self.url, {"date": "2025-02-03"}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(cached.status_code, 304)
+        with mock.patch("api.media.url_window", return_value=101):  # signed URLs in the body were re-minted
+            fresh = self.client.get(self.url, {"date": "2025-02-03"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("cal", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Cal", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/entries/calendar/"
+
+    def test_month_stats_and_previews(self):
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 3, 2), note="x" * 100, summary_text="s")
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 3, 9), note="short")
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 4, 1), note="april")
+        days = self.client.get(self.url, {"month": "2025-03"}).data["days"]
+        self.assertEqual([d["date"] for d in days], ["2025-03-02", "2025-03-09"])
+        self.assertEqual(days[0]["note_preview"], "x" * 80 + "…")
+        self.assertTrue(days[0]["has_summary"])
+        self.assertEqual(days[1]["note_preview"], "short")
+        self.assertFalse(days[1]["has_summary"])
+
+    def test_cached_range_is_invalidated_by_entry_changes(self):
+        entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 3, 2), note="before")
+        self.assertEqual(self.client.get(self.url, {"month": "2025-03"}).data["days"][0]["note_preview"], "before")
+        with self.assertNumQueries(1):  # the version; ownership and the range come from cache
+            self.client.get(self.url, {"month": "2025-03"})
+        entry.note = "after"
+        entry.save()
+        self.assertEqual(self.client.get(self.url, {"month": "2025-03"}).data["days"][0]["note_preview"], "after")
+
+    def test_writes_through_other_processes_are_seen(self):
+        entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 3, 2), note="before")
+        etag = self.client.get(self.url, {"month": "2025-03"})["ETag"]
+        # No signals run in this process, as when another worker handled the edit
+        DayEntry.objects.filter(id=entry.id).update(note="after", updated_at=timezone.now())
+        fresh = self.client.get(self.url, {"month": "2025-03"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.data["days"][0]["note_preview"], "after")
+
+        DayEntry.objects.filter(id=entry.id).delete()
+        self.assertEqual(self.client.get(self.url, {"month": "2025-03"}).data["days"], [])
+
+    def test_bad_range_is_400(self):
+        self.assertEqual(self.client.get(self.url, {"from": "2025-03-02", "to": "2025-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"month": "nope"}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("lea", password="pw")
+        self.first = Profile.objects.create(owner=self.user, name="Lea", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self):
+        return [p["name"] for p in self.client.get("/api/profiles/").data]
+
+    def test_list_is_cached_until_profiles_change(self):
+        self.assertEqual(self.names(), ["Lea"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Lea"])
+
+        self.client.post("/api/profiles/", {"name": "Kid", "is_default": True}, format="json")
+        self.assertEqual(self.names(), ["Kid", "Lea"])  # new default sorts first
+
+        self.client.post(f"/api/profiles/{self.first.id}/avatar/",
+                         {"file": SimpleUploadedFile("a.png", b"png")}, format="multipart")
+        lea = next(p for p in self.client.get("/api/profiles/").data if p["name"] == "Lea")
+        self.assertTrue(lea["avatar_url"].startswith("http://testserver/media/profile_avatars/"))
+
+    def test_ownership_checks_follow_deletes(self):
+        second = Profile.objects.create(owner=self.user, name="Two")
+        url = f"/api/profiles/{second.id}/entries/dates/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.delete(f"/api/profiles/{second.id}/")
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        other = Profile.objects.create(owner=CustomUser.objects.create_user("max", password="pw"), name="Max")
+        self.assertEqual(self.client.get(f"/api/profiles/{other.id}/entries/dates/").status_code, 404)
+
+    def test_profile_created_elsewhere_is_found(self):
+        self.client.get("/api/profiles/")  # this process caches the ids
+        with mock.patch("api.signals.caching.invalidate_profiles"):  # as if created on another worker
+            third = Profile.objects.create(owner=self.user, name="Three")
+        url = f"/api/profiles/{third.id}/entries/dates/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIn("Three", self.names())  # the list was refreshed too
+        with self.assertNumQueries(1):  # ...and the id set, so the check is cached again
+            self.client.get(url)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("ned", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Ned", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/entries/search/"
+
+    def test_note_hits_rank_above_summary_hits_with_marked_snippets(self):
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 1, 1), summary_text="A beach day.")
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 1, 2), note="Fish & chips by the beaches")
+        DayEntry.objects.create(profile=self.profile, date=date(2025, 1, 3), note="Stayed home")
+        other = Profile.objects.create(owner=self.user, name="Other")
+        DayEntry.objects.create(profile=other, date=date(2025, 1, 1), note="beach")
+
+        results = self.client.get(self.url, {"q": "beach"}).data["results"]
+        self.assertEqual([r["date"] for r in results], ["2025-01-02", "2025-01-01"])
+        self.assertEqual(results[0]["note_snippet"], "Fish &amp; chips by the <mark>beaches</mark>")
+        self.assertIn("<mark>beach</mark>", results[1]["summary_snippet"])
+
+    def test_cursor_pages_through_equal_ranks(self):
+        for day in range(1, 8):
+            DayEntry.objects.create(profile=self.profile, date=date(2025, 2, day), note="picnic in the park")
+        seen, url, params = [], self.url, {"q": "picnic", "limit": 3}
+        while url:
+            page = self.client.get(url, params).data
+            seen += [r["id"] for r in page["results"]]
+            url, params = page["next"], None
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"q": "x", "cursor": "garbage"}).status_code, 400)
+
+
+class DatesPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("dan", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Dan", is_default=True)
+        for day in range(1, 26):
+            DayEntry.objects.create(profile=self.profile, date=date(2025, 1, day))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/entries/dates/"
+
+    def test_cursor_walks_all_entries_newest_first(self):
+        seen, url, params = [], self.url, {"limit": 10}
+        while url:
+            page = self.client.get(url, params).data
+            seen += [d["date"] for d in page["results"]]
+            url, params = page["next"], None
+        self.assertEqual(seen, [date(2025, 1, day).isoformat() for day in range(25, 0, -1)])
+
+    def test_deep_pages_cost_the_same(self):
+        first = self.client.get(self.url, {"limit": 5}).data
+        with self.assertNumQueries(1):
+            self.client.get(first["next"])
+
+    def test_limit_is_capped_and_cursor_validated(self):
+        DayEntry.objects.bulk_create(
+            DayEntry(profile=self.profile, date=date(2024, 1, 1) + timedelta(days=i)) for i in range(150))
+        self.assertEqual(len(self.client.get(self.url, {"limit": 10_000}).data["results"]), 100)
+        self.assertEqual(self.client.get(self.url, {"cursor": "garbage"}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BatchUploadTests(TestCase):
+    def test_files_are_stored_and_hashed_in_one_response(self):
+        user = CustomUser.objects.create_user("fay", password="pw")
+        profile = Profile.objects.create(owner=user, name="Fay", is_default=True)
+        entry = DayEntry.objects.create(profile=profile, date=date(2025, 5, 5))
+        client = APIClient()
+        client.force_authenticate(user)
+        files = [SimpleUploadedFile(f"{i}.jpg", b"photo-%d" % i) for i in range(3)]
+        response = client.post(f"/api/profiles/{profile.id}/entries/{entry.id}/upload/batch/",
+                               {"files": files}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["attachments"]), 3)
+        self.assertEqual(len(response.data["entry"]["attachments"]), 3)
+        att = Attachment.objects.get(content_hash=hashlib.sha256(b"photo-1").hexdigest())
+        self.assertEqual(att.file.read(), b"photo-1")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=tempfile.mkdtemp())
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("gus", password="pw")
+        profile = Profile.objects.create(owner=self.user, name="Gus", is_default=True)
+        self.entry = DayEntry.objects.create(profile=profile, date=date(2025, 6, 6))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base = f"/api/profiles/{profile.id}/entries/{self.entry.id}/uploads/"
+
+    def put(self, url, data: bytes, start: int, total: int):
+        return self.client.put(url, data, content_type="application/octet-stream",
+                               HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(data) - 1}/{total}")
+
+    def test_chunks_resume_from_the_server_offset(self):
+        body = b"0123456789" * 10
+        session = self.client.post(self.base, {"filename": "clip.mov", "size": len(body)}, format="json").data
+        url = f"{self.base}{session['id']}/"
+        self.assertEqual(self.put(url, body[:40], 0, len(body)).data["offset"], 40)
+        # A retried or out-of-order chunk is refused with the offset to resume from
+        conflict = self.put(url, body[60:], 60, len(body))
+        self.assertEqual((conflict.status_code, conflict.data["offset"]), (409, 40))
+        self.assertEqual(self.client.post(f"{url}complete/").status_code, 409)
+
+        self.assertEqual(self.client.get(url).data["offset"], 40)
+        self.assertEqual(self.put(url, body[40:], 40, len(body)).data["offset"], len(body))
+        response = self.client.post(f"{url}complete/")
+        self.assertEqual(response.status_code, 201)
+        att = Attachment.objects.get(day_entry=self.entry)
+        self.assertEqual(att.file.read(), body)
+        self.assertEqual(att.content_hash, hashlib.sha256(body).hexdigest())
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_repeated_complete_returns_the_same_attachment(self):
+        session = self.client.post(self.base, {"filename": "a.jpg", "size": 3}, format="json").data
+        url = f"{self.base}{session['id']}/"
+        self.put(url, b"abc", 0, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(f"{url}complete/")
+        again = self.client.post(f"{url}complete/")  # e.g. the response to the first was lost
+        self.assertEqual((first.status_code, again.status_code), (201, 200))
+        self.assertEqual(again.data["attachment"]["id"], first.data["attachment"]["id"])
+        self.assertEqual(Attachment.objects.filter(day_entry=self.entry).count(), 1)
+
+    def test_cors_preflight_allows_content_range(self):
+        response = self.client.options(
+            f"{self.base}1/", HTTP_ORIGIN="http://localhost:5173", HTTP_ACCESS_CONTROL_REQUEST_METHOD="PUT",
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS="authorization,content-range,content-type")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("content-range", response["Access-Control-Allow-Headers"])
+
+    def test_other_users_cannot_see_the_session(self):
+        session = self.client.post(self.base, {"filename": "a.jpg", "size": 3}, format="json").data
+        self.client.force_authenticate(CustomUser.objects.create_user("eve2", password="pw"))
+        self.assertEqual(self.put(f"{self.base}{session['id']}/", b"abc", 0, 3).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=tempfile.mkdtemp())
+class ConcurrentUploadTests(TransactionTestCase):
+    def test_chunk_is_written_outside_a_transaction_and_one_writer_wins(self):
+        user = CustomUser.objects.create_user("ida", password="pw")
+        profile = Profile.objects.create(owner=user, name="Ida", is_default=True)
+        entry = DayEntry.objects.create(profile=profile, date=date(2025, 6, 8))
+        client = APIClient()
+        client.force_authenticate(user)
+        base = f"/api/profiles/{profile.id}/entries/{entry.id}/uploads/"
+        session = client.post(base, {"filename": "clip.mov", "size": 6}, format="json").data
+        write_chunk, seen = uploads.write_chunk, []
+
+        def slow_write(upload, start, stream, length):
+            seen.append(connection.in_atomic_block)
+            written = write_chunk(upload, start, stream, length)
+            # Meanwhile a retry of the same chunk finished first
+            UploadSession.objects.filter(pk=upload.pk).update(received=start + written)
+            return written
+
+        with mock.patch("api.uploads.write_chunk", side_effect=slow_write):
+            response = client.put(f"{base}{session['id']}/", b"abc", content_type="application/octet-stream",
+                                  HTTP_CONTENT_RANGE="bytes 0-2/6")
+        self.assertEqual(seen, [False])
+        self.assertEqual((response.status_code, response.data["offset"]), (409, 3))
+
+    def test_concurrent_completes_finalize_once(self):
+        user = CustomUser.objects.create_user("hal", password="pw")
+        profile = Profile.objects.create(owner=user, name="Hal", is_default=True)
+        entry = DayEntry.objects.create(profile=profile, date=date(2025, 6, 7))
+        client = APIClient()
+        client.force_authenticate(user)
+        base = f"/api/profiles/{profile.id}/entries/{entry.id}/uploads/"
+        session = client.post(base, {"filename": "clip.mov", "size": 3}, format="json").data
+        client.put(f"{base}{session['id']}/", b"abc", content_type="application/octet-stream",
+                   HTTP_CONTENT_RANGE="bytes 0-2/3")
+
+        start, responses = threading.Barrier(2), []
+
+        def complete():
+            other = APIClient()
+            other.force_authenticate(user)
+            start.wait()
+            responses.append(other.post(f"{base}{session['id']}/complete/"))
+
+        threads = [threading.Thread(target=on_own_connection(complete)) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(r.status_code for r in responses), [200, 201])
+        self.assertEqual(len({r.data["attachment"]["id"] for r in responses}), 1)
+        self.assertEqual(Attachment.objects.filter(day_entry=entry).count(), 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DIRECT_TRANSFERS=True, DERIVATIVES_BACKEND="eager")
+class DirectTransferTests(TestCase):
+    """Presigned upload/download flow against the filesystem stand-in for a bucket."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("hal", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Hal", is_default=True)
+        self.entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 7, 7))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base = f"/api/profiles/{self.profile.id}/entries/{self.entry.id}/upload/direct/"
+
+    def ticket(self, body: bytes):
+        return self.client.post(self.base, {"filename": "IMG_1.JPG", "content_type": "image/jpeg",
+                                            "size": len(body), "sha256": hashlib.sha256(body).hexdigest()},
+                                format="json").data
+
+    def test_upload_confirm_and_download_skip_the_api(self):
+        body = b"not really a jpeg"
+        ticket = self.ticket(body)
+        self.assertTrue(ticket["key"].startswith("attachments/") and ticket["key"].endswith(".jpg"))
+        self.assertEqual(self.client.post(f"{self.base}complete/", {"token": ticket["token"]}).status_code, 409)
+
+        anonymous = APIClient()  # the presigned URL is the only credential
+        put = anonymous.put(ticket["upload"]["url"], body, content_type="image/jpeg")
+        self.assertEqual(put.status_code, 200)
+        response = self.client.post(f"{self.base}complete/", {"token": ticket["token"]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        att = Attachment.objects.get(day_entry=self.entry)
+        self.assertEqual((att.file.name, att.content_hash), (ticket["key"], hashlib.sha256(body).hexdigest()))
+
+        download = anonymous.get(response.data["attachment"]["url"])
+        self.assertEqual(b"".join(download.streaming_content), body)
+
+    def test_confirm_is_single_use(self):
+        body = b"confirmed twice"
+        ticket = self.ticket(body)
+        APIClient().put(ticket["upload"]["url"], body, content_type="image/jpeg")
+        first = self.client.post(f"{self.base}complete/", {"token": ticket["token"]}, format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            again = self.client.post(f"{self.base}complete/", {"token": ticket["token"]}, format="json")
+        self.assertEqual((first.status_code, again.status_code), (201, 200))
+        self.assertEqual(again.data["attachment"]["id"], first.data["attachment"]["id"])
+        blob = Blob.objects.get()
+        self.assertEqual((blob.ref_count, Attachment.objects.count()), (1, 1))
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+    def test_store_rejects_other_bytes_and_forged_urls(self):
+        ticket = self.ticket(b"expected")
+        url = ticket["upload"]["url"]
+        self.assertEqual(APIClient().put(url, b"tampered", content_type="image/jpeg").status_code, 400)
+        self.assertEqual(APIClient().put(url[:-3] + "xyz/", b"expected", content_type="image/jpeg").status_code, 403)
+        other = DayEntry.objects.create(profile=self.profile, date=date(2025, 7, 8))
+        wrong_entry = f"/api/profiles/{self.profile.id}/entries/{other.id}/upload/direct/complete/"
+        self.assertEqual(self.client.post(wrong_entry, {"token": ticket["token"]}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("ivy", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Ivy", is_default=True)
+        entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 8, 8))
+        self.att = Attachment.objects.create(file=ContentFile(b"0123456789", name="ivy.jpg"),
+                                             owner_profile=self.profile, day_entry=entry)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.url = client.get(f"/api/profiles/{self.profile.id}/entries/", {"date": "2025-08-08"}) \
+            .data["attachments"][0]["url"]
+
+    def test_signed_url_serves_with_etag_and_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Cache-Control"], "private, max-age=3600")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        partial = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual((partial.status_code, partial["Content-Range"]), (206, "bytes 2-5/10"))
+        self.assertEqual(b"".join(partial.streaming_content), b"2345")
+        self.assertEqual(b"".join(self.client.get(self.url, HTTP_RANGE="bytes=-3").streaming_content), b"789")
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=20-").status_code, 416)
+
+    def test_unsigned_requests_need_the_owner(self):
+        path = self.url.split("?")[0]
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertEqual(self.client.get(path + "?e=9999999999&s=forged").status_code, 404)
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=f"Bearer {token}").status_code, 200)
+        stranger = RefreshToken.for_user(CustomUser.objects.create_user("joe", password="pw")).access_token
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=f"Bearer {stranger}").status_code, 404)
+
+    def test_existing_and_missing_files_look_the_same_without_access(self):
+        existing = self.url.split("?")[0]
+        missing = existing.rsplit("/", 1)[0] + "/" + "0" * 64 + ".jpg"
+        self.assertEqual([self.client.get(existing).status_code, self.client.get(missing).status_code], [404, 404])
+
+    @override_settings(MEDIA_SENDFILE="nginx")
+    def test_sendfile_offload_and_immutable_hashed_names(self):
+        name = f"attachments/derived/{'a' * 64}_thumb.jpg"
+        self.att.thumbnail.save(name.rsplit("/", 1)[1], ContentFile(b"thumb"))
+        response = self.client.get(AttachmentSerializer(self.att).data["thumbnail_url"])
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.att.thumbnail.name}")
+        self.assertEqual(response.content, b"")
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DERIVATIVES_BACKEND="eager")
+class DedupTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("kim", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Kim", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, day: int, body: bytes):
+        entry, _ = DayEntry.objects.get_or_create(profile=self.profile, date=date(2025, 9, day))
+        url = f"/api/profiles/{self.profile.id}/entries/{entry.id}/upload/"
+        return self.client.post(url, {"file": SimpleUploadedFile("same.jpg", body)}, format="multipart")
+
+    def test_same_photo_is_stored_once_and_outlives_each_row(self):
+        for day in (1, 2, 3):
+            self.assertEqual(self.upload(day, b"one photo").status_code, 201)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(set(Attachment.objects.values_list("file", flat=True)), {blob.file.name})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attachment.objects.filter(day_entry__date=date(2025, 9, 1)).delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DayEntry.objects.filter(profile=self.profile).delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(blob.file.storage.exists(blob.file.name))
+
+    def test_adopting_a_blobs_own_file_keeps_it(self):
+        body = b"direct upload"
+        name = default_storage.save("attachments/direct.jpg", ContentFile(body))
+        digest = hashlib.sha256(body).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            blob = blobs.adopt(name, digest, len(body))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(blobs.adopt(name, digest, len(body)), blob)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(default_storage.exists(name))
+
+        copy = default_storage.save("attachments/copy.jpg", ContentFile(body))
+        with self.captureOnCommitCallbacks(execute=True):
+            blobs.adopt(copy, digest, len(body))
+        self.assertFalse(default_storage.exists(copy))  # a second copy of stored content is dropped
+        self.assertTrue(default_storage.exists(name))
+
+    def test_derivatives_are_copied_not_rebuilt(self):
+        img = BytesIO()
+        Image.new("RGB", (40, 30), "red").save(img, format="JPEG")
+        self.upload(1, img.getvalue())
+        with mock.patch("api.derivatives._build") as build:
+            att = Attachment.objects.get(pk=self.upload(2, img.getvalue()).data["attachment"]["id"])
+        build.assert_not_called()
+        self.assertEqual((att.width, att.height), (40, 30))
+        self.assertEqual(att.thumbnail.name, Blob.objects.get().thumbnail.name)
+
+
+
+@override_settings(SERVER_TIMING=True, METRICS_TOKEN="")
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("ines", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Ines", is_default=True)
+        self.entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 4, 1), note="tea")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_timing_headers_and_request_id(self):
+        url = f"/api/profiles/{self.profile.id}/entries/?date=2025-04-01"
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_X_REQUEST_ID="trace-123")
+        self.assertEqual(response["X-Request-ID"], "trace-123")
+        timing = dict(part.split(";", 1) for part in response["Server-Timing"].split(", "))
+        self.assertIn("total", timing)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} calls"', timing["db"])
+        self.assertIn("render", timing)
+
+        garbage = self.client.get(url, HTTP_X_REQUEST_ID="not a header valueé")
+        self.assertRegex(garbage["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    def test_request_id_is_forwarded_to_the_summary_service(self):
+        def send(adapter, request, **kwargs):
+            sent.append(request.headers)
+            response = requests.Response()
+            response.status_code, response._content = 200, b'{"summary": "Tea time."}'
+            return response
+
+        sent = []
+        with mock.patch("requests.adapters.HTTPAdapter.send", send):
+            response = self.client.post(f"/api/profiles/{self.profile.id}/entries/{self.entry.id}/summary/",
+                                        {"style": "short"}, format="json", HTTP_X_REQUEST_ID="trace-456")
+        self.assertEqual(response.data["summary"], "Tea time.")
+        self.assertEqual(sent[0]["X-Request-ID"], "trace-456")
+        self.assertIn("http;dur=", response["Server-Timing"])
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/profiles/")
+        body = self.client.get("/metrics").content.decode()
+        self.assertRegex(body, r'http_requests_total\{view="profiles_list_create",method="GET",status="200",pid="\d+"\} \d+')
+        self.assertIn('http_request_duration_seconds_bucket{view="profiles_list_create",method="GET"', body)
+
+        with self.settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+def fake_recap(period, style, parts):
+    return f"{period} of {len(parts)}: " + " / ".join(part["text"] for part in parts)
+
+
+@override_settings(SUMMARY_QUEUE_BACKEND="eager")
+@mock.patch("api.summaries.request_summary", side_effect=lambda payload, style: f"I wrote: {payload['note']}")
+class RecapTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("rosa", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Rosa", is_default=True)
+        for day, note in ((3, "market"), (4, "swim"), (5, "concert"), (20, "picnic")):
+            DayEntry.objects.create(profile=self.profile, date=date(2025, 3, day), note=note)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/recaps/"
+
+    def post(self, period: str, day: str = "2025-03-04"):
+        with self.captureOnCommitCallbacks(execute=True):  # eager: queued days run here
+            return self.client.post(self.url, {"period": period, "date": day}, format="json")
+
+    def recap(self, period: str, day: str = "2025-03-04"):
+        """A final recap, and how many days the first ask queued to get there."""
+        response = self.post(period, day)
+        queued = response.data["regenerated"]["days"]
+        if response.status_code == 202:
+            response = self.post(period, day)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data, queued
+
+    @mock.patch("api.recaps.request_recap", side_effect=fake_recap)
+    def test_week_is_reduced_from_days_and_reused(self, request_recap, _):
+        data, queued = self.recap("week")
+        self.assertEqual((data["start"], data["end"]), ("2025-03-03", "2025-03-09"))
+        self.assertEqual(data["recap"], "week of 3: I wrote: market / I wrote: swim / I wrote: concert")
+        self.assertEqual((queued, data["regenerated"]), (3, {"days": 0, "weeks": 1, "months": 0}))
+        self.assertEqual(self.recap("week")[0]["regenerated"], {"days": 0, "weeks": 0, "months": 0})
+        self.assertEqual(request_recap.call_count, 1)
+
+        DayEntry.objects.filter(date=date(2025, 3, 4)).update(note="swim and sauna")
+        data, queued = self.recap("week")
+        self.assertEqual((queued, data["regenerated"]["weeks"]), (1, 1))
+
+    @mock.patch("api.recaps.request_recap", side_effect=fake_recap)
+    def test_month_only_redoes_what_changed(self, request_recap, _):
+        self.recap("week")  # 3-9 March is also a whole week of the month
+        data, queued = self.recap("month")
+        self.assertTrue(data["recap"].startswith("month of 2: week of 3: "))
+        self.assertEqual((queued, data["regenerated"]), (1, {"days": 0, "weeks": 1, "months": 1}))
+        self.assertEqual([w["recap"][:9] for w in data["weeks"] if w["recap"]], ["week of 3", "week of 1"])
+        self.assertEqual((data["weeks"][0]["start"], data["weeks"][-1]["end"]), ("2025-03-01", "2025-03-31"))
+
+        DayEntry.objects.filter(date=date(2025, 3, 20)).update(note="picnic in the rain")
+        data, queued = self.recap("month")
+        self.assertEqual((queued, data["regenerated"]), (1, {"days": 0, "weeks": 1, "months": 1}))
+        self.assertEqual(self.recap("month")[0]["regenerated"], {"days": 0, "weeks": 0, "months": 0})
+
+    @override_settings(SUMMARY_QUEUE_BACKEND="database")
+    @mock.patch("api.recaps.request_recap", side_effect=fake_recap)
+    def test_stale_days_are_queued_not_generated_inline(self, request_recap, request_summary):
+        first = self.post("month")
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(len(first.data["pending_jobs"]), 4)
+        self.assertIn("picnic", first.data["recap"])  # stitched from the notes meanwhile
+        self.assertFalse(request_summary.called or request_recap.called or Recap.objects.exists())
+
+        again = self.post("month")  # still queued: polled, not queued twice
+        self.assertEqual((again.status_code, again.data["pending_jobs"]), (202, first.data["pending_jobs"]))
+        self.assertEqual(SummaryJob.objects.count(), 4)
+
+        while jobs.run_job(None):  # what run_summary_workers does
+            pass
+        self.assertEqual(self.post("month").status_code, 200)
+
+    def test_fallback_is_not_stored(self, _):
+        with mock.patch("api.recaps.request_recap", side_effect=requests.ConnectionError):
+            self.assertIn("I wrote: market", self.recap("week")[0]["recap"])
+        self.assertFalse(Recap.objects.exists())
+        with mock.patch("api.recaps.request_recap", return_value="A busy week."):
+            data, queued = self.recap("week")
+        self.assertEqual((data["recap"], queued), ("A busy week.", 0))
+        self.assertTrue(Recap.objects.exists())
+
+
+def on_own_connection(fn, *args):
+    """``fn`` for a thread standing in for another worker, which has its own DB connection."""
+    def run():
+        try:
+            fn(*args)
+        finally:
+            connection.close()
+    return run
+
+
+class SingleFlightTests(TransactionTestCase):
+    """Leases are rows other workers must see, so nothing here runs inside a test transaction."""
+
+    def setUp(self):
+        caches["summaries"].clear()
+
+    def test_concurrent_callers_share_one_run(self):
+        runs, results = [], []
+
+        def call():
+            lease, value = flights.join("k", lease_seconds=10)
+            if lease is not None:
+                runs.append(1)
+                time.sleep(0.2)
+                value = "result"
+                lease.publish(value)
+            results.append(value)
+
+        threads = [threading.Thread(target=on_own_connection(call)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((len(runs), results), (1, ["result"] * 8))
+
+    def test_waiter_takes_over_from_a_failed_leader(self):
+        lease, _ = flights.join("k", lease_seconds=10)
+        threading.Timer(0.1, on_own_connection(lease.release)).start()
+        takeover, value = flights.join("k", lease_seconds=10)
+        self.assertIsNotNone(takeover)
+        self.assertIsNone(value)
+
+    def test_a_lost_leaders_lease_runs_out(self):
+        lost, _ = flights.join("k", lease_seconds=0)  # never publishes nor releases
+        takeover, _ = flights.join("k", lease_seconds=10)
+        self.assertNotEqual(takeover.token, lost.token)
+        lost.publish("late")  # no longer its lease: changes nothing
+        self.assertIsNone(Flight.objects.get(key="k").value)
+
+    @mock.patch("api.summaries.request_summary", return_value="My own call.")
+    def test_summary_request_joins_the_running_generation(self, request_summary):
+        user = CustomUser.objects.create_user("omar", password="pw")
+        profile = Profile.objects.create(owner=user, name="Omar", is_default=True)
+        entry = DayEntry.objects.create(profile=profile, date=date(2025, 5, 1), note="kite festival")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        # Another worker is already generating this summary and finishes shortly
+        lease, _ = flights.join(summary_cache.make_key("kite festival", [], "short"), lease_seconds=10)
+        threading.Timer(0.2, on_own_connection(
+            lease.publish, {"summary": "Kites everywhere.", "generated": True})).start()
+        response = client.post(f"/api/profiles/{profile.id}/entries/{entry.id}/summary/",
+                               {"style": "short"}, format="json")
+        self.assertEqual(response.data["summary"], "Kites everywhere.")
+        request_summary.assert_not_called()
+        entry.refresh_from_db()
+        self.assertEqual(entry.summary_text, "Kites everywhere.")
+
+
+@override_settings(SUMMARY_QUEUE_BACKEND="eager", SUMMARY_JOB_MAX_ATTEMPTS=3)
+class SummaryJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("jo", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Jo", is_default=True)
+        self.entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 6, 1), note="lake day")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/profiles/{self.profile.id}/entries/{self.entry.id}/summary/"
+
+    def make_job(self, **fields) -> SummaryJob:
+        return SummaryJob.objects.create(day_entry=self.entry, payload={"note": "lake day"}, **fields)
+
+    @mock.patch("api.summaries.request_summary", return_value="Calm water.")
+    def test_async_request_runs_eagerly_and_polls_done(self, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {"mode": "async"}, format="json")
+        self.assertEqual((response.status_code, response.data["status"]), (202, SummaryJob.PENDING))
+        polled = self.client.get(response["Location"])
+        self.assertEqual((polled.data["status"], polled.data["summary"]), (SummaryJob.DONE, "Calm water."))
+
+    def test_poll_is_scoped_to_the_owner(self):
+        job = self.make_job()
+        self.client.force_authenticate(CustomUser.objects.create_user("other", password="pw"))
+        self.assertEqual(self.client.get(f"{self.url}jobs/{job.id}/").status_code, 404)
+
+    def test_failed_runs_are_retried_up_to_max_attempts(self):
+        with mock.patch("api.summaries.generate_summary", side_effect=[RuntimeError("boom"), "Second try."]):
+            with self.captureOnCommitCallbacks(execute=True):
+                job = jobs.enqueue(self.entry, {"note": "lake day"}, "short")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (SummaryJob.DONE, 2, "Second try."))
+
+        with mock.patch("api.summaries.generate_summary", side_effect=RuntimeError("boom")) as generate:
+            with self.captureOnCommitCallbacks(execute=True):
+                job = jobs.enqueue(self.entry, {"note": "lake day"}, "short")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (SummaryJob.FAILED, 3, "boom"))
+        self.assertEqual(generate.call_count, 3)
+
+    def test_claim_takes_over_jobs_whose_lease_ran_out(self):
+        now = timezone.now()
+        live = self.make_job(status=SummaryJob.RUNNING, attempts=1, lease_expires_at=now + timedelta(minutes=5))
+        lost = self.make_job(status=SummaryJob.RUNNING, attempts=1, lease_expires_at=now - timedelta(seconds=1))
+        spent = self.make_job(status=SummaryJob.RUNNING, attempts=3, lease_expires_at=now - timedelta(seconds=1))
+
+        job = jobs.claim()
+        self.assertEqual((job.id, job.attempts), (lost.id, 2))
+        self.assertGreater(job.lease_expires_at, now)
+        self.assertIsNone(jobs.claim())  # the live one keeps its worker; the spent one is out of attempts
+
+        self.assertEqual(jobs.reap(), 1)
+        spent.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual((spent.status, live.status), (SummaryJob.FAILED, SummaryJob.RUNNING))
+
+    @override_settings(SUMMARY_QUEUE_BACKEND="thread")
+    def test_polling_an_orphaned_job_requeues_it(self):
+        job = self.make_job()
+        with mock.patch("api.background.submit_on_commit") as submit:
+            self.client.get(f"{self.url}jobs/{job.id}/")  # still in this process's pool
+            submit.assert_not_called()
+            with mock.patch("api.jobs._process_started", timezone.now()):  # queued before a restart
+                self.client.get(f"{self.url}jobs/{job.id}/")
+        submit.assert_called_once_with("summary-worker", mock.ANY, jobs.run_job, job.id)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch("api.circuit.time.monotonic", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=2, slow_call_seconds=5, reset_seconds=30)
+
+    def fail(self):
+        with self.assertRaises(RuntimeError), self.breaker.call():
+            raise RuntimeError("down")
+
+    def test_opens_half_opens_and_closes(self):
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.breaker.call():
+            pass
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()["transitions"],
+                         {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1})
+
+    def test_half_open_lets_one_probe_through_and_reopens_if_it_fails(self):
+        self.fail()
+        self.fail()
+        self.now += 30
+        self.breaker.before_call()  # the probe
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 29
+        self.assertEqual(self.breaker.state, OPEN)  # a fresh reset period from the failed probe
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(2):
+            with self.breaker.call():
+                self.now += 6
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.snapshot()["calls"], {"attempted": 2, "slow": 2, "failed": 2})
+
+    @mock.patch("api.summaries.request_summary", return_value="From the service.")
+    def test_open_circuit_serves_the_fallback_without_calling_the_service(self, request_summary):
+        user = CustomUser.objects.create_user("cy", password="pw")
+        profile = Profile.objects.create(owner=user, name="Cy", is_default=True)
+        entry = DayEntry.objects.create(profile=profile, date=date(2025, 7, 1), note="rainy walk")
+        client = APIClient()
+        client.force_authenticate(user)
+        breaker = CircuitBreaker("gemini", failure_threshold=1, reset_seconds=30)
+        breaker.record_failure()
+        with mock.patch("api.summaries.service_breaker", breaker):
+            response = client.post(f"/api/profiles/{profile.id}/entries/{entry.id}/summary/", format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("rainy walk", response.data["summary"])
+        request_summary.assert_not_called()
+        self.assertEqual(breaker.snapshot()["calls"], {"failed": 1, "rejected": 1})
+
+
+class SummaryStreamTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("sky", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Sky", is_default=True)
+        self.entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 8, 1), note="night swim")
+        self.url = f"/api/profiles/{self.profile.id}/entries/{self.entry.id}/summary/stream/"
+
+    @mock.patch("api.summaries._iter_service_events", side_effect=lambda payload, style: iter(
+        [("message", {"delta": "Warm "}), ("message", {"delta": "water."}), ("done", {"summary": "Warm water."})]))
+    def test_asgi_gets_an_async_stream(self, _):
+        token = RefreshToken.for_user(self.user).access_token
+
+        async def fetch():
+            response = await AsyncClient().post(self.url, {"style": "short"}, content_type="application/json",
+                                                headers={"Authorization": f"Bearer {token}",
+                                                         "Accept": "text/event-stream"})
+            return response, [chunk async for chunk in response.streaming_content]
+
+        response, chunks = async_to_sync(fetch)()
+        self.assertTrue(response.is_async)  # sent chunk by chunk, not collected into a list first
+        self.assertEqual(len(chunks), 3)
+        self.assertIn(b'"delta": "Warm "', chunks[0])
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.summary_text, "Warm water.")
+
+
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        caches["summaries"].clear()
+        self.user = CustomUser.objects.create_user("ines", password="pw")
+        self.profile = Profile.objects.create(owner=self.user, name="Ines", is_default=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summarize(self, day: int, note: str, style: str = "short"):
+        entry = DayEntry.objects.create(profile=self.profile, date=date(2025, 10, day), note=note)
+        response = self.client.post(f"/api/profiles/{self.profile.id}/entries/{entry.id}/summary/",
+                                    {"style": style}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data["summary"]
+
+    @mock.patch("api.summaries.request_summary", return_value="Apples everywhere.")
+    def test_same_content_is_served_from_the_cache(self, request_summary):
+        self.assertEqual(self.summarize(1, "apple picking"), "Apples everywhere.")
+        self.assertEqual(self.summarize(2, "  apple   picking "), "Apples everywhere.")  # same once normalized
+        request_summary.assert_called_once()
+        self.assertEqual(summary_cache.stats(), {"hits": 1, "misses": 1})
+
+        self.summarize(3, "apple picking", style="nostalgic")  # the style is part of the key
+        self.assertEqual(request_summary.call_count, 2)
+
+    @mock.patch("api.summaries.request_summary", side_effect=requests.ConnectionError)
+    def test_fallbacks_are_not_cached(self, request_summary):
+        self.summarize(1, "pear tart")
+        Flight.objects.all().delete()  # later, once the shared result of that flight is gone
+        self.summarize(2, "pear tart")
+        self.assertEqual(request_summary.call_count, 2)
+
+
+@override_settings(OUTBOUND_RETRIES=2, OUTBOUND_BACKOFF=0)
+class OutboundRetryTests(TestCase):
+    def setUp(self):
+        self.hits = Counter()
+        hits, statuses = self.hits, {"/busy": 503, "/gateway": 504}
+
+        class Handler(BaseHTTPRequestHandler):
+            def answer(self):
+                hits[(self.command, self.path)] += 1
+                self.send_response(statuses[self.path])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_GET = do_POST = answer
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base = f"http://127.0.0.1:{server.server_port}"
+        self.session = outbound._build_session()
+
+    def test_post_is_not_resent_after_a_gateway_error(self):
+        self.assertEqual(self.session.post(f"{self.base}/gateway", json={}).status_code, 504)
+        self.assertEqual(self.hits[("POST", "/gateway")], 1)
+
+    def test_get_retries_gateway_errors(self):
+        self.session.get(f"{self.base}/gateway")
+        self.assertEqual(self.hits[("GET", "/gateway")], 3)
+
+    def test_post_retries_when_the_service_turned_it_away(self):
+        self.assertEqual(self.session.post(f"{self.base}/busy", json={}).status_code, 503)
+        self.assertEqual(self.hits[("POST", "/busy")], 3)
+
+    def test_connect_errors_are_retried_then_raised(self):
+        with mock.patch("urllib3.connection.HTTPConnection._new_conn",
+                        side_effect=urllib3.exceptions.NewConnectionError(None, "refused")) as connect:
+            with self.assertRaises(requests.ConnectionError):
+                self.session.post(f"{self.base}/busy", json={})
+        self.assertEqual(connect.call_count, 3)
+        self.assertEqual(self.hits[("POST", "/busy")], 0)
@@ -0,0 +1,119 @@
+# api/uploads.py
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .models import Attachment, UploadSession
+from . import blobs
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Spools every upload to a temp file (never memory) and hashes it on the way in.
+
+    The finished file gets a ``content_hash`` attribute, so Attachment rows can
+    be created without reading the bytes a second time.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        f = super().file_complete(file_size)
+        f.content_hash = self._sha256.hexdigest()
+        return f
+
+
+# ---- Resumable uploads ----
+# Protocol (all under /profiles/<id>/entries/<id>/uploads/):
+#   POST   uploads/                   {filename, size}    -> session with offset 0
+#   PUT    uploads/<id>/              Content-Range: bytes START-END/SIZE, raw body
+#   GET    uploads/<id>/              -> current offset, to resume after a failure
+#   POST   uploads/<id>/complete/     -> moves the bytes to storage as an Attachment
+#   DELETE uploads/<id>/              -> abandon
+CHUNK_READ_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def parse_content_range(header: str):
+    m = CONTENT_RANGE_RE.match(header or "")
+    return tuple(int(x) for x in m.groups()) if m else None
+
+
+def create_session(entry, filename: str, size: int) -> UploadSession:
+    session = UploadSession.objects.create(
+        day_entry=entry,
+        filename=os.path.basename(filename)[:255] or "upload",
+        size=size,
+        expires_at=timezone.now() + timedelta(hours=settings.CHUNKED_UPLOAD_TTL_HOURS),
+    )
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(session.partial_path, "wb").close()
+    return session
+
+
+def write_chunk(session: UploadSession, start: int, stream, length: int) -> int:
+    """Copy up to ``length`` bytes from the request stream into the .part file.
+
+    Returns how many bytes actually arrived, so a dropped connection still
+    counts what made it and the client resumes from there.
+    """
+    written = 0
+    with open(session.partial_path, "r+b") as f:
+        f.seek(start)
+        while written < length:
+            try:
+                data = stream.read(min(CHUNK_READ_SIZE, length - written))
+            except UnreadablePostError:  # client went away mid-chunk
+                break
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+    return written
+
+
+def upload_key(session_id) -> str:
+    """Attachment.upload_key of the row a session was completed into."""
+    return f"resumable:{session_id}"
+
+
+def finalize(session: UploadSession) -> Attachment:
+    """Move the finished bytes to storage as an Attachment and end the session.
+
+    Call with the session row locked (select_for_update), so two completes
+    can't both get here; the loser finds the row by upload_key instead.
+    """
+    path = session.partial_path
+    with open(path, "rb") as fh, transaction.atomic():
+        [blob] = blobs.acquire([File(fh, name=session.filename)])
+        att = blobs.attachment_for(blob, session.day_entry)
+        att.upload_key = upload_key(session.id)
+        att.save()
+        session.delete()
+    transaction.on_commit(lambda: _remove_partial(path))  # kept if the attachment is rolled back
+    return att
+
+
+def _remove_partial(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(session: UploadSession):
+    _remove_partial(session.partial_path)
+    session.delete()
@@ -8,7 +8,11 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     RegisterView,
     ProfileListCreateView, ProfileAvatarUploadView,
-    DayEntryUpsertView, DayEntryUploadView, GenerateSummaryView,DayEntryDatesView, ProfileDeleteView
+    DayEntryUpsertView, DayEntryUploadView, GenerateSummaryView,DayEntryDatesView, ProfileDeleteView,
+    SummaryJobView, GenerateSummaryStreamView, SummaryServiceStatusView, DayEntryCalendarView,
+    DayEntryBatchUploadView, UploadSessionCreateView, UploadSessionView, UploadSessionCompleteView,
+    DirectAttachmentUploadView, DirectAttachmentCompleteView, DirectAvatarUploadView, DirectAvatarCompleteView,
+    DirectObjectView, DayEntrySearchView, RecapView
 )
 
 urlpatterns = [
@@ -21,14 +25,39 @@ urlpatterns = [
     path("profiles/", ProfileListCreateView.as_view(), name="profiles_list_create"),
     path("profiles/<int:profile_id>/", ProfileDeleteView.as_view(), name="profile_delete"),  # Add this line
     path("profiles/<int:profile_id>/avatar/", ProfileAvatarUploadView.as_view(), name="profile_avatar"),
+    path("profiles/<int:profile_id>/avatar/direct/", DirectAvatarUploadView.as_view(), name="profile_avatar_direct"),
+    path("profiles/<int:profile_id>/avatar/direct/complete/", DirectAvatarCompleteView.as_view(), name="profile_avatar_direct_complete"),
 
     # day entries (today default)
     path("profiles/<int:profile_id>/entries/", DayEntryUpsertView.as_view(), name="entry_upsert_get"),
     # upload photo to a specific entry
     path("profiles/<int:profile_id>/entries/<int:entry_id>/upload/", DayEntryUploadView.as_view(), name="entry_upload"),
+    # upload many photos in one multipart request (repeated "files" field)
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/upload/batch/", DayEntryBatchUploadView.as_view(), name="entry_upload_batch"),
+    # resumable/chunked uploads: create a session, PUT byte ranges, then complete
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/uploads/", UploadSessionCreateView.as_view(), name="upload_session_create"),
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/uploads/<uuid:upload_id>/", UploadSessionView.as_view(), name="upload_session"),
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/uploads/<uuid:upload_id>/complete/", UploadSessionCompleteView.as_view(), name="upload_session_complete"),
+    # direct-to-storage: get a presigned PUT, upload to the store, then confirm
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/upload/direct/", DirectAttachmentUploadView.as_view(), name="entry_upload_direct"),
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/upload/direct/complete/", DirectAttachmentCompleteView.as_view(), name="entry_upload_direct_complete"),
+    # presigned URLs when media lives on the local filesystem (api/direct.py)
+    path("direct/<str:token>/", DirectObjectView.as_view(), name="direct_object"),
 
     # generate story summary
     path("profiles/<int:profile_id>/entries/<int:entry_id>/summary/", GenerateSummaryView.as_view(), name="entry_summary"),
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/summary/stream/", GenerateSummaryStreamView.as_view(), name="entry_summary_stream"),
+    # poll an async summary job
+    path("profiles/<int:profile_id>/entries/<int:entry_id>/summary/jobs/<int:job_id>/", SummaryJobView.as_view(), name="summary_job"),
+    # weekly/monthly recap built from the daily summaries ({period, date, style})
+    path("profiles/<int:profile_id>/recaps/", RecapView.as_view(), name="recaps"),
     path("profiles/<int:profile_id>/entries/dates/", DayEntryDatesView.as_view(), name="entry_dates"),
+    # ranked full-text search over notes and summaries (?q=&limit=&cursor=)
+    path("profiles/<int:profile_id>/entries/search/", DayEntrySearchView.as_view(), name="entry_search"),
+    # per-day stats for a month/year/range (?month=YYYY-MM | ?year=YYYY | ?from=&to=)
+    path("profiles/<int:profile_id>/entries/calendar/", DayEntryCalendarView.as_view(), name="entry_calendar"),
+
+    # monitoring (staff only)
+    path("status/summary-service/", SummaryServiceStatusView.as_view(), name="summary_service_status"),
 
 ]
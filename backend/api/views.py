@@ -1,30 +1,45 @@
-from datetime import date as date_cls
+import calendar
+from asgiref.sync import sync_to_async
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date as date_cls, timedelta
+from django.conf import settings
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from django.contrib.auth import get_user_model
-from django.db.models import Count
+from django.core import signing
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, FloatField, Max, Q
+from django.db.models.functions import Cast, Length, Substr
+from django.utils.html import escape
 from rest_framework import generics, permissions
 from rest_framework.views import APIView
+from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.renderers import JSONRenderer
 import logging
-import requests
 
-from .models import Profile, DayEntry, Attachment
+from .models import Profile, DayEntry, Attachment, SummaryJob, UploadSession
 from .serializers import (
     RegisterSerializer,
     ProfileSerializer, DayEntrySerializer,
-    AttachmentSerializer, GenerateSummarySerializer, UpsertDayEntrySerializer
+    AttachmentSerializer, GenerateSummarySerializer, UpsertDayEntrySerializer,
+    SummaryJobSerializer, CreateUploadSessionSerializer, UploadSessionSerializer, DirectUploadSerializer,
+    RecapRequestSerializer,
 )
+from .renderers import EventStreamRenderer, sse_event
+from .uploads import HashingTemporaryFileUploadHandler
+from . import blobs, caching, derivatives, direct, jobs, media, recaps, summaries, summary_cache, uploads
 
 User = get_user_model()
 log = logging.getLogger(__name__)
 
-# FastAPI Gemini service URL
-GEMINI_SERVICE_URL = "http://localhost:8001/generate-summary"
-
 # ---- Auth ----
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -35,8 +50,35 @@ class RegisterView(generics.CreateAPIView):
 def _own_profile_or_404(user, profile_id: int) -> Profile:
     return get_object_or_404(Profile, id=profile_id, owner=user)
 
-def _entry_for(profile: Profile, d: date_cls) -> DayEntry:
-    entry, _ = DayEntry.objects.get_or_create(profile=profile, date=d)
+def _check_profile_owner(user, profile_id: int):
+    # For paths that only need the check, not the row: served from the per-user cache
+    if not caching.owns_profile(user.id, profile_id):
+        raise Http404
+
+def _empty_entry(d: date_cls) -> dict:
+    # What GET returns for a day with no row yet; id is null until the first write
+    return {"id": None, "date": d.isoformat(), "note": "", "summary_text": "",
+            "attachments": [], "created_at": None, "updated_at": None}
+
+def _entry_etag(entry: DayEntry) -> str:
+    # updated_at is bumped by every write that changes the entry's payload; the
+    # signing window changes the attachment URLs in it (see media.url_window)
+    return f'W/"{entry.id}-{int(entry.updated_at.timestamp() * 1_000_000)}-{media.url_window()}"'
+
+def _own_entry_or_404(user, profile_id: int, entry_id: int) -> DayEntry:
+    # The ownership check rides along on the entry lookup: one query, not two
+    return get_object_or_404(DayEntry, id=entry_id, profile_id=profile_id, profile__owner=user)
+
+def _find_entry(user, profile_id: int, d: date_cls):
+    """Existing entry for a date, or None. Never writes."""
+    return DayEntry.objects.filter(profile_id=profile_id, profile__owner=user, date=d).first()
+
+def _entry_for(user, profile_id: int, d: date_cls, defaults=None) -> DayEntry:
+    """Entry for a date, created on first use (write paths only)."""
+    entry = _find_entry(user, profile_id, d)
+    if entry is None:
+        _check_profile_owner(user, profile_id)
+        entry, _ = DayEntry.objects.get_or_create(profile_id=profile_id, date=d, defaults=defaults or {})
     return entry
 
 # ---- Profiles ----
@@ -45,13 +87,18 @@ class ProfileListCreateView(APIView):
     renderer_classes = [JSONRenderer]
 
     def get(self, request):
-        qs = Profile.objects.filter(owner=request.user).order_by("-is_default", "name")
-        data = ProfileSerializer(qs, many=True, context={'request': request}).data
+        data = caching.get_profiles(request.user.id)
+        if data is None:
+            # Cached without a request, so avatar URLs are host-relative until below
+            qs = Profile.objects.filter(owner=request.user).order_by("-is_default", "name")
+            data = ProfileSerializer(qs, many=True).data
+            caching.set_profiles(request.user.id, data)
         log.debug("profiles.list user_id=%s username=%s count=%d",
                   getattr(request.user, "id", None),
                   getattr(request.user, "username", None),
                   len(data))
-        return Response(data)
+        return Response([{**p, "avatar_url": p["avatar_url"] and request.build_absolute_uri(p["avatar_url"])}
+                         for p in data])
 
     def post(self, request):
         name = (request.data.get("name") or "").strip()
@@ -61,6 +108,7 @@ class ProfileListCreateView(APIView):
         prof = Profile.objects.create(owner=request.user, name=name, is_default=is_default)
         if is_default or Profile.objects.filter(owner=request.user).count() == 1:
             Profile.objects.filter(owner=request.user).exclude(id=prof.id).update(is_default=False)
+            caching.invalidate_profiles(request.user.id)  # update() sends no signals
             prof.is_default = True
             prof.save(update_fields=["is_default"])
         log.debug("profiles.create user_id=%s profile_id=%s name=%s",
@@ -85,22 +133,29 @@ class DayEntryUpsertView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, profile_id: int):
-        prof = _own_profile_or_404(request.user, profile_id)
         ser = UpsertDayEntrySerializer(data=request.data)
         ser.is_valid(raise_exception=True)
         d = ser.validated_data.get("date") or timezone.localdate()
-        entry = _entry_for(prof, d)
-        if "note" in ser.validated_data:
-            entry.note = ser.validated_data["note"]
-            entry.save(update_fields=["note"])
+        changes = {k: ser.validated_data[k] for k in ("note",) if k in ser.validated_data}
+        entry = _entry_for(request.user, profile_id, d, defaults=changes)
+        if "note" in changes and entry.note != changes["note"]:
+            entry.note = changes["note"]
+            entry.save(update_fields=["note", "updated_at"])
         return Response(DayEntrySerializer(entry, context={'request': request}).data, status=201)
 
     def get(self, request, profile_id: int):
-        prof = _own_profile_or_404(request.user, profile_id)
+        # Read-only: browsing dates must not insert rows or take write locks
         d_str = request.query_params.get("date")
         d = timezone.localdate() if not d_str else date_cls.fromisoformat(d_str)
-        entry = _entry_for(prof, d)
-        return Response(DayEntrySerializer(entry, context={'request': request}).data)
+        entry = _find_entry(request.user, profile_id, d)
+        if entry is None:
+            _check_profile_owner(request.user, profile_id)
+        etag = _entry_etag(entry) if entry else f'W/"empty-{d.isoformat()}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        data = DayEntrySerializer(entry, context={'request': request}).data if entry else _empty_entry(d)
+        return Response(data, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 # ---- Add photos to entry ----
 class DayEntryUploadView(APIView):
@@ -108,92 +163,470 @@ class DayEntryUploadView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request, profile_id: int, entry_id: int):
-        prof = _own_profile_or_404(request.user, profile_id)
-        entry = get_object_or_404(DayEntry, id=entry_id, profile=prof)
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        request._request.upload_handlers = [HashingTemporaryFileUploadHandler(request._request)]
         f = request.FILES.get("file") or request.data.get("file")
         if not f:
             return Response({"detail": "file required"}, status=400)
-        att = Attachment.objects.create(file=f, owner_profile=prof, day_entry=entry)
-        entry = DayEntry.objects.get(id=entry.id)
+        with transaction.atomic():
+            [blob] = blobs.acquire([f])
+            att = blobs.attachment_for(blob, entry)
+            att.save()
+            entry.save(update_fields=["updated_at"])  # attachments are part of the entry's ETag
+        derivatives.schedule(att)
         return Response({
             "attachment": AttachmentSerializer(att, context={'request': request}).data,
             "entry": DayEntrySerializer(entry, context={'request': request}).data
         }, status=201)
 
+# ---- Add many photos in one request ----
+MAX_BATCH_FILES = 50
+
+class DayEntryBatchUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request, profile_id: int, entry_id: int):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        # Must be set before the body is parsed: stream each file to disk, hashing as it goes
+        request._request.upload_handlers = [HashingTemporaryFileUploadHandler(request._request)]
+        files = request.FILES.getlist("files")
+        if not files:
+            return Response({"detail": "files required"}, status=400)
+        if len(files) > MAX_BATCH_FILES:
+            return Response({"detail": f"at most {MAX_BATCH_FILES} files per request"}, status=400)
+
+        with transaction.atomic():
+            # Content already stored (even by another day or profile) isn't copied again
+            atts = Attachment.objects.bulk_create(
+                [blobs.attachment_for(blob, entry) for blob in blobs.acquire(files)])
+            entry.save(update_fields=["updated_at"])
+        for att in {att.blob_id: att for att in atts}.values():  # once per distinct photo
+            derivatives.schedule(att)
+        return Response({
+            "attachments": AttachmentSerializer(atts, many=True, context={'request': request}).data,
+            "entry": DayEntrySerializer(entry, context={'request': request}).data
+        }, status=201)
+
+# ---- Resumable uploads for large media (protocol in api/uploads.py) ----
+def _own_upload_or_404(user, profile_id: int, entry_id: int, upload_id) -> UploadSession:
+    return get_object_or_404(
+        UploadSession.objects.select_related("day_entry"), id=upload_id, day_entry_id=entry_id,
+        day_entry__profile_id=profile_id, day_entry__profile__owner=user, expires_at__gt=timezone.now())
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int, entry_id: int):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        ser = CreateUploadSessionSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        session = uploads.create_session(entry, ser.validated_data["filename"], ser.validated_data["size"])
+        return Response(UploadSessionSerializer(session).data, status=201)
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, profile_id: int, entry_id: int, upload_id):
+        session = _own_upload_or_404(request.user, profile_id, entry_id, upload_id)
+        return Response(UploadSessionSerializer(session).data)
+
+    def put(self, request, profile_id: int, entry_id: int, upload_id):
+        session = _own_upload_or_404(request.user, profile_id, entry_id, upload_id)
+        content_range = uploads.parse_content_range(request.headers.get("Content-Range"))
+        if content_range is None:
+            return Response({"detail": "Content-Range: bytes START-END/SIZE required"}, status=400)
+        start, end, total = content_range
+        if total != session.size or end < start or end >= total:
+            return Response({"detail": "range doesn't fit this upload", "offset": session.received}, status=416)
+        # Chunks must arrive in order. No lock or transaction is held while the
+        # body comes in (a slow client would keep both for the whole chunk); the
+        # compare-and-set below lets exactly one writer per offset advance
+        if start != session.received:
+            return Response({"detail": "expected a chunk starting at offset", "offset": session.received},
+                            status=409)
+        received = start + uploads.write_chunk(session, start, request.stream, end - start + 1)
+        if not UploadSession.objects.filter(pk=session.pk, received=start).update(received=received):
+            session.refresh_from_db(fields=["received"])  # a concurrent PUT of this chunk won
+            return Response({"detail": "expected a chunk starting at offset", "offset": session.received},
+                            status=409)
+        session.received = received
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, profile_id: int, entry_id: int, upload_id):
+        uploads.discard(_own_upload_or_404(request.user, profile_id, entry_id, upload_id))
+        return Response(status=204)
+
+class UploadSessionCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int, entry_id: int, upload_id):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        with transaction.atomic():
+            # A concurrent complete of the same session waits here, then finds it gone
+            session = UploadSession.objects.select_for_update().filter(
+                id=upload_id, day_entry=entry, expires_at__gt=timezone.now()).first()
+            if session is None:
+                done = get_object_or_404(Attachment, upload_key=uploads.upload_key(upload_id), day_entry=entry)
+                return self._completed(request, done, entry, status=200)
+            if session.received != session.size:
+                return Response({"detail": "upload incomplete", "offset": session.received}, status=409)
+            att = uploads.finalize(session)
+            entry.save(update_fields=["updated_at"])
+        derivatives.schedule(att)
+        return self._completed(request, att, entry, status=201)
+
+    def _completed(self, request, att, entry, status: int):
+        return Response({
+            "attachment": AttachmentSerializer(att, context={'request': request}).data,
+            "entry": DayEntrySerializer(entry, context={'request': request}).data
+        }, status=status)
+
+# ---- Direct-to-storage transfers (see api/direct.py) ----
+def _direct_ticket(request, upload_to: str, **claims):
+    if not settings.DIRECT_TRANSFERS:
+        return Response({"detail": "direct transfers are disabled"}, status=404)
+    ser = DirectUploadSerializer(data=request.data)
+    ser.is_valid(raise_exception=True)
+    v = ser.validated_data
+    key = direct.new_key(upload_to, v["filename"])
+    return Response({
+        "key": key,
+        "upload": direct.presign_put(request, key, v["content_type"], v["size"], v["sha256"]),
+        "token": direct.upload_ticket(k=key, h=v["sha256"], n=v["size"], **claims),
+    }, status=201)
+
+def _direct_confirmed(request, **claims) -> dict:
+    """Key, hash and size from a confirm token issued for ``claims``."""
+    try:
+        ticket = direct.load(request.data.get("token") or "", "confirm")
+    except signing.BadSignature:
+        raise ParseError("invalid or expired token")
+    if any(ticket.get(k) != v for k, v in claims.items()):
+        raise ParseError("token was issued for a different target")
+    return ticket
+
+class DirectAttachmentUploadView(APIView):
+    """POST {filename, content_type, size, sha256} -> presigned PUT + confirm token."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int, entry_id: int):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        return _direct_ticket(request, Attachment.file.field.upload_to, e=entry.id)
+
+class DirectAttachmentCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int, entry_id: int):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        ticket = _direct_confirmed(request, e=entry.id)
+        # Confirming is single-use: a retry or replay gets the row the first confirm made
+        done = Attachment.objects.filter(upload_key=ticket["k"]).first()
+        if done is not None:
+            return self._confirmed(request, done, entry, status=200)
+        if not direct.stored(ticket["k"]):
+            return Response({"detail": "object not uploaded yet"}, status=409)
+        try:
+            # The store checked the signed checksum, so the hash needs no read-back
+            with transaction.atomic():
+                att = blobs.attachment_for(blobs.adopt(ticket["k"], ticket["h"], ticket["n"]), entry)
+                att.upload_key = ticket["k"]
+                att.save()
+                entry.save(update_fields=["updated_at"])
+        except IntegrityError:  # a concurrent confirm of the same upload got there first
+            return self._confirmed(request, Attachment.objects.get(upload_key=ticket["k"]), entry, status=200)
+        derivatives.schedule(att)
+        return self._confirmed(request, att, entry, status=201)
+
+    def _confirmed(self, request, att, entry, status: int):
+        return Response({
+            "attachment": AttachmentSerializer(att, context={'request': request}).data,
+            "entry": DayEntrySerializer(entry, context={'request': request}).data
+        }, status=status)
+
+class DirectAvatarUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int):
+        prof = _own_profile_or_404(request.user, profile_id)
+        return _direct_ticket(request, Profile.avatar.field.upload_to, p=prof.id)
+
+class DirectAvatarCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int):
+        prof = _own_profile_or_404(request.user, profile_id)
+        ticket = _direct_confirmed(request, p=prof.id)
+        if not direct.stored(ticket["k"]):
+            return Response({"detail": "object not uploaded yet"}, status=409)
+        prof.avatar = ticket["k"]
+        prof.save(update_fields=["avatar"])
+        return Response(ProfileSerializer(prof, context={'request': request}).data)
+
+class DirectObjectView(APIView):
+    """Filesystem stand-in for a bucket's presigned PUT; the signed token is the only credential."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def _payload(self, token: str, op: str) -> dict:
+        try:
+            return direct.load(token, op)
+        except signing.BadSignature:
+            raise PermissionDenied("invalid or expired signature")
+
+    def put(self, request, token: str):
+        payload = self._payload(token, "put")
+        try:
+            direct.receive(payload["k"], request.stream, payload["n"], payload["h"])
+        except direct.ChecksumMismatch:
+            return Response({"detail": "body does not match the signed size and checksum"}, status=400)
+        return Response(status=200)
+
+
 # ---- Generate AI story summary via FastAPI/Gemini ----
 class GenerateSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, profile_id: int, entry_id: int):
-        prof = _own_profile_or_404(request.user, profile_id)
-        entry = get_object_or_404(DayEntry, id=entry_id, profile=prof)
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
         ser = GenerateSummarySerializer(data=request.data)
         ser.is_valid(raise_exception=True)
         style = ser.validated_data["style"]
+        payload = summaries.build_payload(entry, request)
 
-        note = (entry.note or "").strip()
-        photo_count = entry.attachments.count()
-        
-        # Get image URLs for Gemini to analyze
-        image_urls = [
-            request.build_absolute_uri(att.file.url) 
-            for att in entry.attachments.all()
-        ]
+        if ser.validated_data["mode"] == "async":
+            # Don't hold this worker for the LLM round-trip; client polls the job
+            job = jobs.enqueue(entry, payload, style)
+            poll_url = request.build_absolute_uri(
+                reverse("summary_job", args=[entry.profile_id, entry.id, job.id]))
+            return Response(SummaryJobSerializer(job).data, status=202, headers={"Location": poll_url})
 
-        try:
-            # Call FastAPI Gemini service
-            response = requests.post(
-                GEMINI_SERVICE_URL,
-                json={
-                    "note": note,
-                    "photo_count": photo_count,
-                    "image_urls": image_urls,
-                    "style": style
-                },
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
-            summary = data.get("summary", "")
-            
-            entry.summary_text = summary
-            entry.save(update_fields=["summary_text"])
-            
-            return Response({"summary": entry.summary_text})
-        
-        except requests.exceptions.RequestException as e:
-            log.error(f"Error calling Gemini service: {str(e)}")
-            # Fallback to simple summary if AI service fails
-            opener = {"short":"Today's moments:", "cheerful":"What a lovely day!", "nostalgic":"Another day to remember."}[style]
-            parts = []
-            if photo_count: 
-                parts.append(f"I snapped {photo_count} photo{'s' if photo_count!=1 else ''}.")
-            if note:
-                parts.append((note[:220] + "…") if len(note) > 220 else note)
-            closing = {"short":"Feeling grateful.", "cheerful":"Hope this brings a smile 😊", "nostalgic":"Thinking of the good old times."}[style]
-            
-            entry.summary_text = f"{opener} " + " ".join(parts) + f" {closing}"
-            entry.save(update_fields=["summary_text"])
-            return Response({"summary": entry.summary_text})
+        return Response({"summary": summaries.generate_summary(entry, payload, style)})
+
+async def _each_in_thread(chunks):
+    """Async iterator over a sync one, pulling each chunk in a worker thread as it's produced."""
+    chunks, done = iter(chunks), object()
+    try:
+        while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()  # client went away: let the generator clean up
+
+class GenerateSummaryStreamView(APIView):
+    """Same as GenerateSummaryView, relayed to the browser as Server-Sent Events."""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request, profile_id: int, entry_id: int):
+        entry = _own_entry_or_404(request.user, profile_id, entry_id)
+        ser = GenerateSummarySerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        payload = summaries.build_payload(entry, request)
+        events = summaries.stream_summary(entry, payload, ser.validated_data["style"])
+        chunks = (sse_event(data, event) for event, data in events)
+        if isinstance(request._request, ASGIRequest):
+            # Django drains sync iterators into a list under ASGI; hand it an async one
+            chunks = _each_in_thread(chunks)
+        response = StreamingHttpResponse(chunks, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+        return response
+
+class SummaryJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, profile_id: int, entry_id: int, job_id: int):
+        job = get_object_or_404(SummaryJob, id=job_id, day_entry_id=entry_id,
+                                day_entry__profile_id=profile_id, day_entry__profile__owner=request.user)
+        jobs.nudge(job)  # its worker may have gone away with a restart
+        return Response(SummaryJobSerializer(job).data)
+
+# ---- Weekly/monthly recaps reduced from daily summaries (see api/recaps.py) ----
+class RecapView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, profile_id: int):
+        _check_profile_owner(request.user, profile_id)
+        ser = RecapRequestSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        data = ser.validated_data
+        recap = recaps.build(request, profile_id, data["period"], data["date"], data["style"])
+        # 202: stale days were queued and the recap is provisional; POST again to poll
+        return Response(recap, status=202 if recap["pending_jobs"] else 200)
+
+# ---- Per-day stats shared by the dates and calendar views ----
+NOTE_PREVIEW_CHARS = 80
+
+def _with_day_stats(qs):
+    # Previews are cut in SQL so full notes never leave the DB
+    return (qs.annotate(attachments_count=Count("attachments"),
+                        note_head=Substr("note", 1, NOTE_PREVIEW_CHARS),
+                        note_length=Length("note"),
+                        has_summary=ExpressionWrapper(~Q(summary_text=""), output_field=BooleanField()))
+              .values("id", "date", "attachments_count", "note_head", "note_length", "has_summary"))
+
+def _day_stats(row) -> dict:
+    return {
+        "entry_id": row["id"],
+        "date": row["date"].isoformat(),
+        "attachments_count": row["attachments_count"],
+        "has_summary": row["has_summary"],
+        "note_preview": row["note_head"] + ("…" if row["note_length"] > NOTE_PREVIEW_CHARS else ""),
+    }
 
 # ---- List recent day-entry dates for a profile ----
+MAX_DATES_PAGE = 100
+
+def _encode_dates_cursor(d: date_cls, entry_id: int) -> str:
+    return urlsafe_b64encode(f"{d.isoformat()}|{entry_id}".encode()).decode()
+
+def _decode_dates_cursor(cursor: str):
+    try:
+        d, entry_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date_cls.fromisoformat(d), int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ParseError("invalid cursor")
+
 class DayEntryDatesView(APIView):
+    """Entry history, newest first, paged by an opaque keyset cursor on (date, id).
+
+    Every page is an index range scan on (profile, date), so page 50 costs
+    the same as page 1.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, profile_id: int):
-        prof = _own_profile_or_404(request.user, profile_id)
-        limit = int(request.query_params.get("limit", 30))
-        qs = (DayEntry.objects
-              .filter(profile=prof)
-              .annotate(attachments_count=Count("attachments"))
-              .order_by("-date")[:limit])
-        data = [{
-            "entry_id": e.id,
-            "date": e.date.isoformat(),
-            "attachments_count": e.attachments_count,
-            "note_preview": ((e.note[:80] + "…") if e.note and len(e.note) > 80 else (e.note or "")),
-        } for e in qs]
-        return Response(data)
+        _check_profile_owner(request.user, profile_id)
+        try:
+            limit = min(max(int(request.query_params.get("limit", 30)), 1), MAX_DATES_PAGE)
+        except ValueError:
+            raise ParseError("limit must be an integer")
+        qs = DayEntry.objects.filter(profile_id=profile_id)
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            after_date, after_id = _decode_dates_cursor(cursor)
+            qs = qs.filter(Q(date__lt=after_date) | Q(date=after_date, id__lt=after_id))
+        rows = list(_with_day_stats(qs.order_by("-date", "-id"))[:limit + 1])
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            params = request.query_params.copy()
+            params["cursor"] = _encode_dates_cursor(last["date"], last["id"])
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+        return Response({"next": next_url, "results": [_day_stats(r) for r in rows]})
+
+# ---- Full-text search over notes and summaries ----
+MAX_SEARCH_PAGE = 50
+SNIPPET_START, SNIPPET_STOP = "\x02", "\x03"  # swapped for <mark> after escaping
+
+def _encode_search_cursor(rank: float, entry_id: int) -> str:
+    return urlsafe_b64encode(f"{rank!r}|{entry_id}".encode()).decode()
+
+def _decode_search_cursor(cursor: str):
+    try:
+        rank, entry_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ParseError("invalid cursor")
+
+def _headline(field: str, query: SearchQuery) -> SearchHeadline:
+    return SearchHeadline(field, query, config="english", start_sel=SNIPPET_START, stop_sel=SNIPPET_STOP,
+                          max_words=25, min_words=10, max_fragments=2)
+
+def _snippet(text: str) -> str:
+    # ts_headline returns the raw note; escape it so only our <mark>s are markup
+    return escape(text).replace(SNIPPET_START, "<mark>").replace(SNIPPET_STOP, "</mark>")
+
+class DayEntrySearchView(APIView):
+    """Ranked hits for ?q= (web-search syntax: "phrases", or, -exclude) with highlighted snippets.
+
+    Matching uses the GIN index on DayEntry.search_vector, so only matching
+    rows are ranked; pages continue with a keyset cursor on (rank, id).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, profile_id: int):
+        _check_profile_owner(request.user, profile_id)
+        q = (request.query_params.get("q") or "").strip()
+        if not q:
+            raise ParseError("q required")
+        try:
+            limit = min(max(int(request.query_params.get("limit", 20)), 1), MAX_SEARCH_PAGE)
+        except ValueError:
+            raise ParseError("limit must be an integer")
+
+        query = SearchQuery(q, search_type="websearch", config="english")
+        # ts_rank is a float4; as float8 it round-trips exactly through the cursor
+        qs = (DayEntry.objects.filter(profile_id=profile_id, search_vector=query)
+              .annotate(rank=Cast(SearchRank(F("search_vector"), query), FloatField())))
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            after_rank, after_id = _decode_search_cursor(cursor)
+            qs = qs.filter(Q(rank__lt=after_rank) | Q(rank=after_rank, id__lt=after_id))
+        # Headlines are costly, but Postgres only computes them for rows that survive the LIMIT
+        rows = list(qs.annotate(note_snippet=_headline("note", query),
+                                summary_snippet=_headline("summary_text", query))
+                    .order_by("-rank", "-id")
+                    .values("id", "date", "rank", "note_snippet", "summary_snippet")[:limit + 1])
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            params = request.query_params.copy()
+            params["cursor"] = _encode_search_cursor(rows[-1]["rank"], rows[-1]["id"])
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+        log.debug("entries.search profile_id=%s q=%r hits=%d", profile_id, q, len(rows))
+        return Response({"next": next_url, "results": [
+            {"id": r["id"], "date": r["date"].isoformat(), "rank": r["rank"],
+             "note_snippet": _snippet(r["note_snippet"]), "summary_snippet": _snippet(r["summary_snippet"])}
+            for r in rows
+        ]})
+
+# ---- Calendar: per-day stats for a month/year/range ----
+MAX_CALENDAR_DAYS = 366
+
+def _calendar_range(params):
+    """Inclusive (start, end) from ?month=YYYY-MM, ?year=YYYY or ?from=&to=."""
+    try:
+        if params.get("month"):
+            year, month = (int(x) for x in params["month"].split("-"))
+            return date_cls(year, month, 1), date_cls(year, month, calendar.monthrange(year, month)[1])
+        if params.get("year"):
+            year = int(params["year"])
+            return date_cls(year, 1, 1), date_cls(year, 12, 31)
+        start = date_cls.fromisoformat(params["from"])
+        end = date_cls.fromisoformat(params.get("to") or params["from"])
+    except (KeyError, ValueError):
+        raise ParseError("pass month=YYYY-MM, year=YYYY, or from=YYYY-MM-DD&to=YYYY-MM-DD")
+    if end < start or end - start >= timedelta(days=MAX_CALENDAR_DAYS):
+        raise ParseError(f"range must be ascending and at most {MAX_CALENDAR_DAYS} days")
+    return start, end
+
+class DayEntryCalendarView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, profile_id: int):
+        _check_profile_owner(request.user, profile_id)
+        start, end = _calendar_range(request.query_params)
+        days = DayEntry.objects.filter(profile_id=profile_id, date__range=(start, end))
+        # Read from the DB so every worker agrees: writes move the latest
+        # updated_at, deletes move the counts
+        stamp = days.aggregate(n=Count("id", distinct=True), files=Count("attachments"), latest=Max("updated_at"))
+        latest = int(stamp["latest"].timestamp() * 1_000_000) if stamp["latest"] else 0
+        version = f"{stamp['n']}.{stamp['files']}.{latest}"
+        etag = f'W/"calendar-{profile_id}-{version}-{start.isoformat()}-{end.isoformat()}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        key = caching.calendar_key(profile_id, version, start, end)
+        data = caching.get_calendar(key)
+        if data is None:
+            # One aggregated query for the whole range
+            rows = _with_day_stats(days).order_by("date")
+            data = {"from": start.isoformat(), "to": end.isoformat(), "days": [_day_stats(r) for r in rows]}
+            caching.set_calendar(key, data)
+        return Response(data, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 class ProfileDeleteView(APIView):
     permission_classes = [IsAuthenticated]
@@ -214,4 +647,14 @@ class ProfileDeleteView(APIView):
         log.debug("profiles.delete user_id=%s profile_id=%s name=%s",
                   getattr(request.user, "id", None), profile_id, prof_name)
         
-        return Response({"detail": "Profile deleted successfully"}, status=204)
\ No newline at end of file
+        return Response({"detail": "Profile deleted successfully"}, status=204)
+
+# ---- Summary service health, for monitoring ----
+class SummaryServiceStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "breaker": summaries.service_breaker.snapshot(),
+            "cache": summary_cache.stats(),
+        })
@@ -0,0 +1,5 @@
+# api/ws_urls.py
+# WebSocket routes for core/asgi.py. Summary streaming is served over SSE by
+# GenerateSummaryStreamView (plain HTTP, so JWT auth works unchanged), so
+# there are no socket consumers yet.
+websocket_urlpatterns = []
@@ -14,6 +14,7 @@ from pathlib import Path
 from datetime import timedelta
 import os
 
+from corsheaders.defaults import default_headers
 from decouple import config, Csv           # pip install python-decouple
 from dotenv import load_dotenv             # pip install python-dotenv
 
@@ -48,6 +49,9 @@ if DEBUG:
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 
+# Resumable chunk PUTs carry their offset in Content-Range, which isn't a
+# CORS-safelisted header, so the preflight has to allow it explicitly.
+CORS_ALLOW_HEADERS = (*default_headers, "content-range")
 
 CSRF_TRUSTED_ORIGINS = [
     "https://87b64aba47d4.ngrok-free.app",
@@ -64,6 +68,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     "rest_framework",
     "rest_framework_simplejwt",
@@ -111,8 +116,46 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+# ----------------------------
+# Outbound HTTP (see api/outbound.py)
+# ----------------------------
+GEMINI_SERVICE_URL = config("GEMINI_SERVICE_URL", default="http://localhost:8001")  # FastAPI Gemini service
+OUTBOUND_CONNECT_TIMEOUT = config("OUTBOUND_CONNECT_TIMEOUT", default=3.05, cast=float)  # seconds
+OUTBOUND_READ_TIMEOUT = config("OUTBOUND_READ_TIMEOUT", default=30.0, cast=float)  # seconds between bytes
+OUTBOUND_POOL_SIZE = config("OUTBOUND_POOL_SIZE", default=20, cast=int)  # keep-alive connections per host
+OUTBOUND_RETRIES = config("OUTBOUND_RETRIES", default=2, cast=int)
+OUTBOUND_BACKOFF = config("OUTBOUND_BACKOFF", default=0.3, cast=float)
+
+# ----------------------------
+# Summary jobs (see api/jobs.py)
+# ----------------------------
+SUMMARY_QUEUE_BACKEND = config("SUMMARY_QUEUE_BACKEND", default="thread")  # thread | database | eager
+SUMMARY_WORKERS = config("SUMMARY_WORKERS", default=4, cast=int)
+# Longer than any one summary call (timeouts x retries), so a live worker never loses its job
+SUMMARY_JOB_LEASE_SECONDS = config("SUMMARY_JOB_LEASE_SECONDS", default=300, cast=int)
+SUMMARY_JOB_MAX_ATTEMPTS = config("SUMMARY_JOB_MAX_ATTEMPTS", default=3, cast=int)
+# "path" sends storage keys instead of media URLs; only for a microservice that
+# can see the same MEDIA_ROOT (same host or shared volume). Remote storages always use URLs.
+SUMMARY_IMAGE_TRANSPORT = config("SUMMARY_IMAGE_TRANSPORT", default="url")  # url | path
+# Circuit breaker around the Gemini service (see api/circuit.py)
+SUMMARY_BREAKER_FAILURES = config("SUMMARY_BREAKER_FAILURES", default=5, cast=int)
+SUMMARY_BREAKER_SLOW_CALL_SECONDS = config("SUMMARY_BREAKER_SLOW_CALL_SECONDS", default=10.0, cast=float)
+SUMMARY_BREAKER_RESET_SECONDS = config("SUMMARY_BREAKER_RESET_SECONDS", default=30.0, cast=float)
+# Concurrent requests for the same summary share one model call (see api/flights.py);
+# longer than any single call, so a live leader never loses its lease
+SUMMARY_FLIGHT_LEASE_SECONDS = config("SUMMARY_FLIGHT_LEASE_SECONDS", default=120, cast=int)
+
+# ----------------------------
+# Upload derivatives (see api/derivatives.py)
+# ----------------------------
+DERIVATIVES_BACKEND = config("DERIVATIVES_BACKEND", default="thread")  # thread | eager
+DERIVATIVE_WORKERS = config("DERIVATIVE_WORKERS", default=2, cast=int)
+MODEL_INPUT_MAX_EDGE = config("MODEL_INPUT_MAX_EDGE", default=1024, cast=int)  # px
+THUMBNAIL_MAX_EDGE = config("THUMBNAIL_MAX_EDGE", default=320, cast=int)  # px
+
 
 MIDDLEWARE = [
+    "api.metrics.RequestMetricsMiddleware",  # first, so its timings cover the whole stack
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -203,6 +246,47 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Resumable uploads (see api/uploads.py): partial files live outside MEDIA_ROOT
+# so they're never served, and move to default storage when finalized
+CHUNKED_UPLOAD_DIR = config("CHUNKED_UPLOAD_DIR", default=os.path.join(BASE_DIR, "upload_partials"))
+CHUNKED_UPLOAD_MAX_SIZE = config("CHUNKED_UPLOAD_MAX_SIZE", default=2 * 1024 ** 3, cast=int)  # bytes
+CHUNKED_UPLOAD_TTL_HOURS = config("CHUNKED_UPLOAD_TTL_HOURS", default=24, cast=int)
+
+# ----------------------------
+# Media storage (see api/direct.py)
+# ----------------------------
+# Media goes to MEDIA_ROOT unless AWS_STORAGE_BUCKET_NAME is set; for MinIO, R2
+# or another S3-compatible store also set AWS_S3_ENDPOINT_URL. Credentials come
+# from the usual AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY environment.
+# DIRECT_TRANSFERS hands clients presigned URLs so media bytes skip Django.
+DIRECT_TRANSFERS = config("DIRECT_TRANSFERS", default=False, cast=bool)
+DIRECT_URL_TTL = config("DIRECT_URL_TTL", default=900, cast=int)  # seconds a presigned URL stays valid
+# Local media is served by api/media.py behind signed URLs. Set MEDIA_SENDFILE to
+# "nginx" (X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an `internal` location aliased
+# to MEDIA_ROOT) or "sendfile" (X-Sendfile, Apache/lighttpd) to let the web
+# server send the bytes.
+MEDIA_SENDFILE = config("MEDIA_SENDFILE", default="")  # "" | nginx | sendfile
+MEDIA_ACCEL_PREFIX = config("MEDIA_ACCEL_PREFIX", default="/protected-media/")
+MEDIA_URL_TTL = config("MEDIA_URL_TTL", default=24 * 3600, cast=int)  # signed media URLs live 1-2x this
+AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME", default="")
+if AWS_STORAGE_BUCKET_NAME:
+    AWS_S3_ENDPOINT_URL = config("AWS_S3_ENDPOINT_URL", default=None)
+    AWS_S3_REGION_NAME = config("AWS_S3_REGION_NAME", default=None)
+    AWS_S3_SIGNATURE_VERSION = "s3v4"
+    AWS_QUERYSTRING_EXPIRE = DIRECT_URL_TTL
+    STORAGES = {
+        "default": {"BACKEND": "storages.backends.s3.S3Storage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+
+# ----------------------------
+# Instrumentation (see api/metrics.py)
+# ----------------------------
+# Server-Timing headers tell clients where the time went (db, http, storage,
+# render); off by default outside DEBUG since they expose internals.
+SERVER_TIMING = config("SERVER_TIMING", default=DEBUG, cast=bool)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")  # if set, /metrics requires "Authorization: Bearer <token>"
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "api.CustomUser"
 
@@ -217,10 +301,38 @@ CHANNEL_LAYERS = {
 }
 
 
-# --- Note implement caching with redis ---
+# ----------------------------
+# Caches
+# ----------------------------
+# Local memory by default; set REDIS_URL to share caches across workers
+# (give Redis an allkeys-lru maxmemory-policy so the summary cache evicts LRU).
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {"BACKEND": "django_redis.cache.RedisCache", "LOCATION": REDIS_URL},
+        "summaries": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "summaries",
+            "TIMEOUT": config("SUMMARY_CACHE_TTL", default=7 * 24 * 3600, cast=int),
+        },
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "summaries": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "summaries",
+            "TIMEOUT": config("SUMMARY_CACHE_TTL", default=7 * 24 * 3600, cast=int),
+            "OPTIONS": {"MAX_ENTRIES": config("SUMMARY_CACHE_MAX_ENTRIES", default=5000, cast=int)},
+        },
+    }
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "filters": {"request_id": {"()": "api.metrics.RequestIdFilter"}},
+    "formatters": {"default": {"format": "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"}},
+    "handlers": {"console": {"class": "logging.StreamHandler", "filters": ["request_id"], "formatter": "default"}},
     "root": {"handlers": ["console"], "level": "DEBUG"},
 }
@@ -18,13 +18,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
+from api import media, metrics
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/", include("api.urls")),
+    path("metrics", metrics.metrics_view, name="metrics"),  # Prometheus scrape target
+    # access-checked media with Range/ETag/sendfile (replaces the dev-only static() view)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", media.serve, name="media"),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
 
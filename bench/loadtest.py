@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""Load test and benchmark harness for the backend + Gemini microservice.
+
+Starts Django (gunicorn or runserver) and gemini-microservice/main.py with the
+fake Gemini client (GEMINI_FAKE=1), seeds a user with entries and synthetic
+photos, then drives a weighted mix of API calls at increasing concurrency.
+Reports p50/p95/p99 latency, throughput and errors per endpoint, plus the
+number of DB queries each endpoint runs.
+
+    cd backend && python ../bench/loadtest.py --mix default --levels 1 4 16 --duration 20
+    python ../bench/loadtest.py --save             # write bench/baselines/<mix>.json
+    python ../bench/loadtest.py --compare          # exit 1 if worse than the baseline
+
+No baselines are committed: numbers only compare on the same machine, so run
+once with --save (e.g. on main) before using --compare.
+
+Uses the database from the usual DB_* settings; point DB_NAME at a scratch
+database, since the run creates tables and data. The api app keeps no
+migrations in the repo, so the run first does `makemigrations api` (into
+backend/api/migrations/, don't commit them) and then `migrate`.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+SERVICE = os.path.join(ROOT, "gemini-microservice")
+BASELINES = os.path.join(ROOT, "bench", "baselines")
+
+# Relative weights per operation
+MIXES = {
+    "default": {"profiles": 15, "entry_get": 35, "entry_upsert": 20, "upload": 15, "summary": 15},
+    "browse": {"profiles": 20, "entry_get": 50, "dates": 30},
+    "write": {"entry_upsert": 40, "upload": 40, "summary": 20},
+}
+NOTES = ["Walked to the park", "Coffee with friends", "Rainy day, stayed in with a book",
+         "Birthday dinner", "Long bike ride by the lake", "Worked late, quiet evening"]
+STYLES = ["short", "cheerful", "nostalgic"]
+
+
+# ---- Fixtures ----
+def make_fixtures(n: int, seed: int = 7) -> list:
+    """Synthetic JPEG photos of a few realistic sizes."""
+    rng = random.Random(seed)
+    fixtures = []
+    for i in range(n):
+        w, h = rng.choice([(4032, 3024), (1920, 1080), (1280, 960), (800, 600)])
+        small = Image.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3))
+        out = BytesIO()
+        small.resize((w, h), Image.BILINEAR).save(out, format="JPEG", quality=85)
+        fixtures.append(out.getvalue())
+    return fixtures
+
+
+def unique_photo(fixtures: list) -> bytes:
+    # Trailing bytes after the JPEG end marker are ignored by decoders but give
+    # every upload its own hash, so content dedup doesn't turn uploads into no-ops
+    return random.choice(fixtures) + os.urandom(16)
+
+
+# ---- Processes ----
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+class Servers:
+    """Django + the microservice as subprocesses, logs in a temp dir."""
+
+    def __init__(self, args):
+        self.args = args
+        self.procs = []
+        self.logdir = tempfile.mkdtemp(prefix="loadtest-")
+        self.service_url = f"http://127.0.0.1:{free_port()}"
+        self.api_url = f"http://127.0.0.1:{free_port()}"
+
+    def _spawn(self, name: str, cmd: list, cwd: str, env: dict):
+        log = open(os.path.join(self.logdir, f"{name}.log"), "w")
+        self.procs.append(subprocess.Popen(cmd, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=log))
+
+    def django_env(self) -> dict:
+        return {"GEMINI_SERVICE_URL": self.service_url}
+
+    def __enter__(self):
+        a = self.args
+        service_port = self.service_url.rsplit(":", 1)[1]
+        self._spawn("gemini", [sys.executable, "-m", "uvicorn", "main:app", "--port", service_port,
+                               "--log-level", "warning"], SERVICE, {
+            "GEMINI_FAKE": "1",
+            "FAKE_GEMINI_LATENCY": str(a.model_latency),
+            "FAKE_GEMINI_TOKEN_DELAY": str(a.token_delay),
+        })
+        api_port = self.api_url.rsplit(":", 1)[1]
+        if a.server == "gunicorn":
+            cmd = ["gunicorn", "core.wsgi", "-b", f"127.0.0.1:{api_port}",
+                   "-w", str(a.workers), "--threads", str(a.threads)]
+        else:
+            cmd = [sys.executable, "manage.py", "runserver", f"127.0.0.1:{api_port}", "--noreload"]
+        self._spawn("django", cmd, BACKEND, self.django_env())
+        wait_for(self.service_url + "/")
+        wait_for(self.api_url + "/api/profiles/")
+        print(f"servers up (logs in {self.logdir})")
+        return self
+
+    def __exit__(self, *exc):
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+# ---- HTTP adapters: the same operations run over the network and in-process ----
+class RemoteHttp:
+    def __init__(self, base: str, token: str = ""):
+        self.base = base
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def get(self, path, params=None):
+        r = self.session.get(self.base + path, params=params, timeout=120)
+        return r.status_code, r.content
+
+    def post_json(self, path, data):
+        r = self.session.post(self.base + path, json=data, timeout=120)
+        return r.status_code, r.content
+
+    def post_file(self, path, field, name, body):
+        r = self.session.post(self.base + path, files={field: (name, body, "image/jpeg")}, timeout=120)
+        return r.status_code, r.content
+
+
+class LocalHttp:
+    """django.test.Client against the same database, for counting queries."""
+
+    def __init__(self, token: str):
+        from django.test import Client
+        self.client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def get(self, path, params=None):
+        r = self.client.get(path, params or {})
+        return r.status_code, b"" if r.streaming else r.content
+
+    def post_json(self, path, data):
+        r = self.client.post(path, data, content_type="application/json")
+        return r.status_code, r.content
+
+    def post_file(self, path, field, name, body):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        r = self.client.post(path, {field: SimpleUploadedFile(name, body, "image/jpeg")})
+        return r.status_code, r.content
+
+
+# ---- Operations ----
+class Workload:
+    def __init__(self, profile_id: int, entries: dict, fixtures: list):
+        self.profile_id = profile_id
+        self.entries = entries  # ISO date -> entry id
+        self.fixtures = fixtures
+        self.base = f"/api/profiles/{profile_id}/entries/"
+
+    def _day(self):
+        return random.choice(list(self.entries))
+
+    def profiles(self, http):
+        return http.get("/api/profiles/")
+
+    def entry_get(self, http):
+        return http.get(self.base, {"date": self._day()})
+
+    def dates(self, http):
+        return http.get(self.base + "dates/", {"limit": 30})
+
+    def entry_upsert(self, http):
+        return http.post_json(self.base, {"date": self._day(), "note": f"{random.choice(NOTES)} #{random.randrange(10**6)}"})
+
+    def upload(self, http):
+        entry_id = self.entries[self._day()]
+        return http.post_file(f"{self.base}{entry_id}/upload/", "file", "photo.jpg", unique_photo(self.fixtures))
+
+    def summary(self, http):
+        entry_id = self.entries[self._day()]
+        return http.post_json(f"{self.base}{entry_id}/summary/", {"style": random.choice(STYLES)})
+
+
+def seed(http: RemoteHttp, days: int, photos_per_day: int, fixtures: list):
+    username = f"bench-{int(time.time())}-{random.randrange(10**6)}"
+    http.post_json("/api/register/", {"username": username, "password": "bench-pass-123"})
+    status, body = http.post_json("/api/token/", {"username": username, "password": "bench-pass-123"})
+    if status != 200:
+        raise RuntimeError(f"login failed: {status} {body[:200]}")
+    token = json.loads(body)["access"]
+    http = RemoteHttp(http.base, token)
+    _, body = http.post_json("/api/profiles/", {"name": "Bench", "is_default": True})
+    profile_id = json.loads(body)["id"]
+    entries = {}
+    today = date.today()
+    for i in range(days):
+        d = (today - timedelta(days=i)).isoformat()
+        _, body = http.post_json(f"/api/profiles/{profile_id}/entries/", {"date": d, "note": random.choice(NOTES)})
+        entries[d] = json.loads(body)["id"]
+        for _ in range(photos_per_day):
+            http.post_file(f"/api/profiles/{profile_id}/entries/{entries[d]}/upload/", "file", "seed.jpg",
+                           unique_photo(fixtures))
+    return token, Workload(profile_id, entries, fixtures)
+
+
+# ---- Driving load ----
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def run_level(base: str, token: str, workload: Workload, mix: dict, concurrency: int, duration: float) -> dict:
+    ops, weights = zip(*mix.items())
+    deadline = time.monotonic() + duration
+
+    def worker(_):
+        http = RemoteHttp(base, token)
+        samples = []
+        while time.monotonic() < deadline:
+            op = random.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, _ = getattr(workload, op)(http)
+                ok = status < 400
+            except requests.RequestException:
+                ok = False
+            samples.append((op, time.perf_counter() - started, ok))
+        return samples
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = [s for batch in pool.map(worker, range(concurrency)) for s in batch]
+    elapsed = time.monotonic() - started
+
+    report = {}
+    for op in ops:
+        latencies = sorted(t for o, t, ok in samples if o == op and ok)
+        errors = sum(1 for o, _, ok in samples if o == op and not ok)
+        report[op] = {
+            "count": len(latencies), "errors": errors, "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        }
+    return report
+
+
+def count_queries(token: str, workload: Workload, ops, service_url: str) -> dict:
+    """Queries per call for each operation, measured in-process against the same database."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    os.environ["GEMINI_SERVICE_URL"] = service_url
+    sys.path.insert(0, BACKEND)
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    http = LocalHttp(token)
+    counts = {}
+    for op in ops:
+        getattr(workload, op)(http)  # warm caches the way steady traffic would
+        with CaptureQueriesContext(connection) as ctx:
+            getattr(workload, op)(http)
+        counts[op] = len(ctx.captured_queries)
+    return counts
+
+
+# ---- Reporting ----
+def print_report(result: dict):
+    print(f"\nmix={result['mix']}  server={result['server']}  duration={result['duration']}s per level")
+    for level, ops in result["levels"].items():
+        print(f"\n concurrency {level}")
+        print(f"   {'endpoint':<14}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'queries':>9}")
+        for op, r in ops.items():
+            print(f"   {op:<14}{r['rps']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+                  f"{r['errors']:>8}{result['queries'].get(op, '-'):>9}")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    for op, n in result["queries"].items():
+        if op in baseline.get("queries", {}) and n > baseline["queries"][op]:
+            problems.append(f"{op}: {n} queries (baseline {baseline['queries'][op]})")
+    for level, ops in result["levels"].items():
+        for op, r in ops.items():
+            b = baseline.get("levels", {}).get(level, {}).get(op)
+            if not b:
+                continue
+            if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+                problems.append(f"c={level} {op}: p95 {r['p95_ms']}ms (baseline {b['p95_ms']}ms)")
+            if b["rps"] and r["rps"] < b["rps"] * (1 - tolerance):
+                problems.append(f"c={level} {op}: {r['rps']} req/s (baseline {b['rps']})")
+            if r["errors"] > b["errors"]:
+                problems.append(f"c={level} {op}: {r['errors']} errors (baseline {b['errors']})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32], help="concurrency steps")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency level")
+    parser.add_argument("--server", choices=["gunicorn", "runserver"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--days", type=int, default=60, help="entries to seed")
+    parser.add_argument("--photos-per-day", type=int, default=1)
+    parser.add_argument("--model-latency", type=float, default=1.0, help="fake Gemini seconds before first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="fake Gemini seconds per token")
+    parser.add_argument("--skip-migrate", action="store_true")
+    parser.add_argument("--save", action="store_true", help="save the result as this mix's baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if worse than this mix's baseline")
+    parser.add_argument("--baseline", help=f"baseline file (default {BASELINES}/<mix>.json)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args()
+    baseline_path = args.baseline or os.path.join(BASELINES, f"{args.mix}.json")
+    if args.compare and not args.save and not os.path.exists(baseline_path):
+        parser.error(f"no baseline at {baseline_path}; run once with --save first")
+
+    if not args.skip_migrate:
+        # migrate alone creates no api tables: the app has a migrations package but no migrations
+        subprocess.run([sys.executable, "manage.py", "makemigrations", "api", "--noinput", "-v", "0"],
+                       cwd=BACKEND, check=True)
+        subprocess.run([sys.executable, "manage.py", "migrate", "--noinput", "-v", "0"], cwd=BACKEND, check=True)
+    fixtures = make_fixtures(12)
+    mix = MIXES[args.mix]
+    result = {"mix": args.mix, "server": args.server, "duration": args.duration, "levels": {}, "queries": {}}
+    with Servers(args) as servers:
+        token, workload = seed(RemoteHttp(servers.api_url), args.days, args.photos_per_day, fixtures)
+        for level in args.levels:
+            print(f"concurrency {level}...", flush=True)
+            result["levels"][str(level)] = run_level(servers.api_url, token, workload, mix, level, args.duration)
+        result["queries"] = count_queries(token, workload, mix, servers.service_url)
+
+    print_report(result)
+    if args.save:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nbaseline saved to {baseline_path}")
+    if args.compare:
+        with open(baseline_path) as f:
+            problems = compare(result, json.load(f), args.tolerance)
+        if problems:
+            print("\nREGRESSIONS vs baseline:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\nno regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
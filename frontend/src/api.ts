@@ -218,8 +218,33 @@ export const upsertEntry = (
     token
   );
 
-export const listDates = (token: string, profileId: number, limit = 30) =>
-  req(`/profiles/${profileId}/entries/dates/?limit=${limit}`, {}, token);
+// Newest first; pass the previous page's `next` cursor to keep scrolling back
+export const listDates = (
+  token: string,
+  profileId: number,
+  limit = 30,
+  cursor?: string
+) =>
+  req(
+    `/profiles/${profileId}/entries/dates/?limit=${limit}` +
+      (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""),
+    {},
+    token
+  );
+
+// Best matches first; snippets are HTML-escaped with <mark> around the hits
+export const searchEntries = (
+  token: string,
+  profileId: number,
+  q: string,
+  cursor?: string
+) =>
+  req(
+    `/profiles/${profileId}/entries/search/?q=${encodeURIComponent(q)}` +
+      (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""),
+    {},
+    token
+  );
 
 export const uploadPhoto = (
   token: string,
@@ -236,6 +261,120 @@ export const uploadPhoto = (
   );
 };
 
+// Several photos in one request; responds with all new attachments + the entry
+export const uploadPhotos = (
+  token: string,
+  profileId: number,
+  entryId: number,
+  files: File[]
+) => {
+  const fd = new FormData();
+  files.forEach((f) => fd.append("files", f));
+  return req(
+    `/profiles/${profileId}/entries/${entryId}/upload/batch/`,
+    { method: "POST", body: fd },
+    token
+  );
+};
+
+// Large files (videos) go up in chunks; a dropped connection resumes from the
+// server's offset instead of starting over. Failed chunks are retried with
+// exponential backoff; after maxAttempts in a row without progress it gives up.
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export async function uploadResumable(
+  token: string,
+  profileId: number,
+  entryId: number,
+  file: File,
+  chunkSize = 5 * 1024 * 1024,
+  maxAttempts = 6
+) {
+  const base = `/profiles/${profileId}/entries/${entryId}/uploads/`;
+  const session = await req(
+    base,
+    { method: "POST", body: JSON.stringify({ filename: file.name, size: file.size }) },
+    token
+  );
+  const url = `${base}${session.id}/`;
+  let offset: number = session.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    const end = Math.min(offset + chunkSize, file.size);
+    try {
+      const res = await req(
+        url,
+        {
+          method: "PUT",
+          body: file.slice(offset, end),
+          headers: {
+            "Content-Type": "application/octet-stream",
+            "Content-Range": `bytes ${offset}-${end - 1}/${file.size}`,
+          },
+        },
+        token
+      );
+      offset = res.offset;
+      failures = 0;
+    } catch (e) {
+      if (++failures >= maxAttempts) throw e;
+      await sleep(Math.min(500 * 2 ** (failures - 1), 30_000));
+      try {
+        const resumed: number = (await req(url, {}, token)).offset;
+        if (resumed > offset) failures = 0; // part of the chunk made it
+        offset = resumed;
+      } catch {
+        // still unreachable; the next PUT attempt counts against maxAttempts
+      }
+    }
+  }
+  return req(`${url}complete/`, { method: "POST" }, token);
+}
+
+// Upload straight to object storage (when the server has DIRECT_TRANSFERS on):
+// get a presigned PUT, send the bytes to the store, then confirm with the token.
+async function sha256Hex(file: File) {
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+async function uploadDirect(token: string, path: string, file: File) {
+  const ticket = await req(
+    path,
+    {
+      method: "POST",
+      body: JSON.stringify({
+        filename: file.name,
+        content_type: file.type || "application/octet-stream",
+        size: file.size,
+        sha256: await sha256Hex(file),
+      }),
+    },
+    token
+  );
+  const res = await fetch(ticket.upload.url, {
+    method: ticket.upload.method,
+    headers: ticket.upload.headers,
+    body: file,
+  });
+  if (!res.ok) throw new Error(`Upload failed (${res.status})`);
+  return req(
+    `${path}complete/`,
+    { method: "POST", body: JSON.stringify({ token: ticket.token }) },
+    token
+  );
+}
+
+export const uploadPhotoDirect = (
+  token: string,
+  profileId: number,
+  entryId: number,
+  file: File
+) => uploadDirect(token, `/profiles/${profileId}/entries/${entryId}/upload/direct/`, file);
+
+export const uploadAvatarDirect = (token: string, profileId: number, file: File) =>
+  uploadDirect(token, `/profiles/${profileId}/avatar/direct/`, file);
+
 export const generateSummary = (
   token: string,
   profileId: number,
@@ -247,3 +386,104 @@ export const generateSummary = (
     { method: "POST", body: JSON.stringify({ style }) },
     token
   );
+
+// Queue the summary instead of waiting on the model; poll getSummaryJob
+export const generateSummaryAsync = (
+  token: string,
+  profileId: number,
+  entryId: number,
+  style: "short" | "cheerful" | "nostalgic" = "short"
+) =>
+  req(
+    `/profiles/${profileId}/entries/${entryId}/summary/`,
+    { method: "POST", body: JSON.stringify({ style, mode: "async" }) },
+    token
+  );
+
+// "My week" / "my month": built from the daily summaries; only days, weeks and
+// months whose inputs changed since the last call go back to the model. Stale
+// days are queued as summary jobs: until they finish the recap is provisional
+// (HTTP 202, non-empty pending_jobs), so call again after a pause.
+export const getRecap = (
+  token: string,
+  profileId: number,
+  period: "week" | "month",
+  date?: string,
+  style: "short" | "cheerful" | "nostalgic" = "short"
+) =>
+  req(
+    `/profiles/${profileId}/recaps/`,
+    { method: "POST", body: JSON.stringify({ period, style, ...(date ? { date } : {}) }) },
+    token
+  );
+
+export const getSummaryJob = (
+  token: string,
+  profileId: number,
+  entryId: number,
+  jobId: number
+) =>
+  req(
+    `/profiles/${profileId}/entries/${entryId}/summary/jobs/${jobId}/`,
+    {},
+    token
+  );
+
+// Stream the summary as it's generated (Server-Sent Events over fetch, so the
+// bearer token still works). onText gets the text so far; resolves with the
+// saved summary from the final "done" event.
+export async function streamSummary(
+  token: string,
+  profileId: number,
+  entryId: number,
+  style: "short" | "cheerful" | "nostalgic" = "short",
+  onText: (text: string) => void = () => {}
+): Promise<string> {
+  const res = await fetch(
+    `${API}/profiles/${profileId}/entries/${entryId}/summary/stream/`,
+    {
+      method: "POST",
+      mode: "cors",
+      credentials: "omit",
+      headers: {
+        "Content-Type": "application/json",
+        Accept: "text/event-stream",
+        Authorization: `Bearer ${token}`,
+      },
+      body: JSON.stringify({ style }),
+    }
+  );
+  if (!res.ok || !res.body) throw new Error(`Error ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      const json = data ? JSON.parse(data) : {};
+      if (event === "message") {
+        text += json.delta || "";
+        onText(text);
+      } else if (event === "done") {
+        onText(json.summary);
+        return json.summary as string;
+      } else if (event === "error") {
+        throw new Error(json.detail || "Failed to generate summary");
+      }
+    }
+  }
+  return text;
+}
@@ -9,14 +9,19 @@ import {
 import {
   getEntry,
   upsertEntry,
-  uploadPhoto,
-  generateSummary,
+  uploadPhotos,
+  streamSummary,
   listDates,
 } from "../api";
 
-type Attachment = { id: number; url: string; created_at: string };
-type DayEntry = {
+type Attachment = {
   id: number;
+  url: string;
+  thumbnail_url: string;
+  created_at: string;
+};
+type DayEntry = {
+  id: number | null; // null until the day has a note or photo
   date: string;
   note: string;
   summary_text: string;
@@ -98,7 +103,7 @@ export default function Journal() {
   async function loadRecentDates(tok: string, pid: number) {
     try {
       const data = await listDates(tok, pid, 20);
-      const entriesWithDetails: EntryWithDetails[] = (data || []).map(
+      const entriesWithDetails: EntryWithDetails[] = (data?.results || []).map(
         (d: DateItem) => ({
           ...d,
           loaded: false,
@@ -117,7 +122,7 @@ export default function Journal() {
                 if (updated[index]) {
                   updated[index] = {
                     ...updated[index],
-                    firstImageUrl: entryData.attachments[0].url,
+                    firstImageUrl: entryData.attachments[0].thumbnail_url,
                     loaded: true,
                   };
                 }
@@ -149,15 +154,24 @@ export default function Journal() {
     }
   }
 
+  // Browsing a day doesn't create it; do that before attaching anything
+  async function ensureEntryId(tok: string, pid: number): Promise<number> {
+    if (entry?.id) return entry.id;
+    const created = await upsertEntry(tok, pid, currentDate);
+    setEntry(created);
+    return created.id;
+  }
+
   async function handlePhotoUpload(e: React.ChangeEvent<HTMLInputElement>) {
     if (!token || !profileId || !entry) return;
-    const file = e.target.files?.[0];
-    if (!file) return;
+    const files = Array.from(e.target.files || []);
+    if (!files.length) return;
 
     setUploading(true);
     setError("");
     try {
-      const resp = await uploadPhoto(token, profileId, entry.id, file);
+      const entryId = await ensureEntryId(token, profileId);
+      const resp = await uploadPhotos(token, profileId, entryId, files);
       setEntry(resp.entry);
       if (fileInputRef.current) fileInputRef.current.value = "";
       await loadRecentDates(token, profileId);
@@ -173,8 +187,10 @@ export default function Journal() {
     setGenerating(true);
     setError("");
     try {
-      await generateSummary(token, profileId, entry.id, summaryStyle);
-      await loadEntry(token, profileId, currentDate);
+      const entryId = await ensureEntryId(token, profileId);
+      await streamSummary(token, profileId, entryId, summaryStyle, (text) =>
+        setEntry((prev) => (prev ? { ...prev, summary_text: text } : prev))
+      );
     } catch (e: any) {
       setError(e?.message || "Failed to generate summary");
     } finally {
@@ -383,6 +399,7 @@ export default function Journal() {
               ref={fileInputRef}
               type="file"
               accept="image/*"
+              multiple
               onChange={handlePhotoUpload}
               style={{ display: "none" }}
             />
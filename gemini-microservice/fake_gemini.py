@@ -0,0 +1,58 @@
+# Stand-in for genai.Client, for load tests and local runs without an API key.
+# Enabled with GEMINI_FAKE=1 (see main.py). Answers after a configurable delay
+# and streams word by word, so the service's concurrency limits, SSE path and
+# image handling behave as they would against the real model.
+import asyncio
+import random
+from types import SimpleNamespace
+
+WORDS = ("sunny walk park coffee friends laughter quiet evening dinner photos "
+         "garden music afternoon market bike ride sunset lake books rain").split()
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, latency: float, jitter: float, token_delay: float, tokens: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.calls = 0
+
+    def _text(self, contents) -> list:
+        parts = len(getattr(contents, "parts", None) or [])
+        rng = random.Random(parts * 7919 + self.calls)
+        words = [rng.choice(WORDS) for _ in range(self.tokens)]
+        words[0] = words[0].capitalize()
+        return [f"{w} " for w in words[:-1]] + [f"{words[-1]}."]
+
+    async def _think(self):
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def generate_content(self, model: str, contents):
+        self.calls += 1
+        await self._think()
+        await asyncio.sleep(self.token_delay * self.tokens)
+        return _Chunk("".join(self._text(contents)))
+
+    async def generate_content_stream(self, model: str, contents):
+        self.calls += 1
+        await self._think()
+        words = self._text(contents)
+
+        async def chunks():
+            for word in words:
+                await asyncio.sleep(self.token_delay)
+                yield _Chunk(word)
+        return chunks()
+
+
+class FakeClient:
+    """Mimics the slice of genai.Client main.py uses: ``client.aio.models.*``."""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, token_delay: float = 0.02, tokens: int = 40):
+        self.aio = SimpleNamespace(models=_FakeModels(latency, jitter, token_delay, tokens))
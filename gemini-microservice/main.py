@@ -1,13 +1,24 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from decouple import config
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import mmap
+import os
 import httpx
 from io import BytesIO
 from PIL import Image as PILImage
 import base64
+import json
+import logging
+import time
+
+import metrics
 
 # Import the new Google GenAI SDK
 from google import genai
@@ -16,18 +27,142 @@ from google.genai.types import Part, Content
 # Load environment variables from .env file
 load_dotenv()
 
-# Get API key from environment
-GEMINI_API_KEY = config("GEMINI_API_KEY", default=config("GEMINI_KEY", default=None))
-if not GEMINI_API_KEY:
-    raise RuntimeError("❌ Set GEMINI_API_KEY in your .env file")
+# Every record carries the request's correlation id (X-Request-ID from Django)
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+_log_handler = logging.StreamHandler()
+_log_handler.addFilter(metrics.RequestIdFilter())
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+log = logging.getLogger("summary_service")
+log.addHandler(_log_handler)
+log.setLevel(LOG_LEVEL)
+log.propagate = False  # uvicorn configures the root logger its own way
+
+# GEMINI_FAKE=1 swaps in a local stand-in (fake_gemini.py) for load tests and
+# offline development; no API key needed, latency and streaming are tunable.
+GEMINI_FAKE = config("GEMINI_FAKE", default=False, cast=bool)
+
+if GEMINI_FAKE:
+    from fake_gemini import FakeClient
+    client = FakeClient(
+        latency=config("FAKE_GEMINI_LATENCY", default=1.0, cast=float),  # seconds before the first token
+        jitter=config("FAKE_GEMINI_JITTER", default=0.2, cast=float),
+        token_delay=config("FAKE_GEMINI_TOKEN_DELAY", default=0.02, cast=float),  # seconds per streamed word
+        tokens=config("FAKE_GEMINI_TOKENS", default=40, cast=int),
+    )
+    log.info("🧪 Using the fake Gemini client (GEMINI_FAKE=1)")
+else:
+    # Get API key from environment
+    GEMINI_API_KEY = config("GEMINI_API_KEY", default=config("GEMINI_KEY", default=None))
+    if not GEMINI_API_KEY:
+        raise RuntimeError("❌ Set GEMINI_API_KEY in your .env file")
+
+    log.info("✅ Gemini API Key loaded: %s...", GEMINI_API_KEY[:10])
+
+    # Initialize the Gemini client
+    client = genai.Client(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+# Image fetching limits
+MAX_IMAGES = 5
+IMAGE_FETCH_CONCURRENCY = config("IMAGE_FETCH_CONCURRENCY", default=5, cast=int)  # per request
+IMAGE_FETCH_DEADLINE = config("IMAGE_FETCH_DEADLINE", default=15.0, cast=float)  # seconds, all images together
+HTTP_MAX_CONNECTIONS = config("HTTP_MAX_CONNECTIONS", default=50, cast=int)
+HTTP_MAX_KEEPALIVE = config("HTTP_MAX_KEEPALIVE", default=20, cast=int)
+
+# Django's MEDIA_ROOT, when this service shares a filesystem with the backend.
+# Lets requests send storage keys (image_paths) instead of URLs.
+MEDIA_ROOT = config("MEDIA_ROOT", default="")
+
+# Image normalization: decode/resize/encode runs off the event loop
+IMAGE_MAX_EDGE = config("IMAGE_MAX_EDGE", default=1024, cast=int)  # px, longest side sent to Gemini
+IMAGE_JPEG_QUALITY = config("IMAGE_JPEG_QUALITY", default=85, cast=int)
+IMAGE_WORKERS = config("IMAGE_WORKERS", default=2, cast=int)
+IMAGE_EXECUTOR = config("IMAGE_EXECUTOR", default="process")  # process | thread
+
+# Max Gemini calls in flight per process; more requests wait their turn.
+# GEMINI_MAX_QUEUE > 0 rejects new requests with 503 once that many are waiting.
+GEMINI_CONCURRENCY = config("GEMINI_CONCURRENCY", default=8, cast=int)
+GEMINI_MAX_QUEUE = config("GEMINI_MAX_QUEUE", default=0, cast=int)
+
+# Shared HTTP client, opened/closed with the app so image downloads reuse connections
+http_client: Optional[httpx.AsyncClient] = None
+image_pool: Optional[Executor] = None
 
-print(f"✅ Gemini API Key loaded: {GEMINI_API_KEY[:10]}...")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client, image_pool
+    image_pool = (ProcessPoolExecutor if IMAGE_EXECUTOR == "process" else ThreadPoolExecutor)(
+        max_workers=IMAGE_WORKERS)
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                            max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+    )
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        http_client = None
+        image_pool.shutdown(cancel_futures=True)
+        image_pool = None
+
+class ConcurrencyLimiter:
+    """Semaphore that keeps queue-depth and wait-time numbers for /stats."""
+
+    def __init__(self, limit: int, max_queue: int = 0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def __aenter__(self):
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Summary service is busy, try again shortly")
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        metrics.record("queue", waited)
+        self.acquired += 1
+        self.in_flight += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
 
-# Initialize the Gemini client
-client = genai.Client(api_key=GEMINI_API_KEY)
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "wait_seconds_avg": self.wait_seconds_total / self.acquired if self.acquired else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+gemini_limiter = ConcurrencyLimiter(GEMINI_CONCURRENCY, GEMINI_MAX_QUEUE)
 
 # Create FastAPI app
-app = FastAPI(title="Gemini Summary Service", version="1.0.0")
+app = FastAPI(title="Gemini Summary Service", version="1.0.0", lifespan=lifespan)
+
+# Correlation id, Server-Timing and /metrics numbers for every request
+app.middleware("http")(metrics.middleware)
 
 # Enable CORS for frontend access
 app.add_middleware(
@@ -43,48 +178,142 @@ class SummaryRequest(BaseModel):
     note: str = ""
     photo_count: int = 0
     image_urls: List[str] = []
+    image_paths: List[str] = []  # storage keys relative to MEDIA_ROOT
     style: str = "short"
 
 class SummaryResponse(BaseModel):
     summary: str
 
+class RecapPart(BaseModel):
+    label: str  # "Mon 03 Mar" for a day, "03 Mar - 09 Mar" for a week
+    text: str
+
+class RecapRequest(BaseModel):
+    period: str = "week"  # week (parts are days) | month (parts are weeks)
+    style: str = "short"
+    parts: List[RecapPart]
+
+STYLE_PROMPTS = {
+    "short": "Write a brief, simple 1–2 sentence summary",
+    "cheerful": "Write an upbeat, happy 2–3 sentence summary with positive energy and enthusiasm",
+    "nostalgic": "Write a warm, reflective 2–3 sentence summary that captures memories and sentiment",
+}
+
 # Root endpoint
 @app.get("/")
 def read_root():
     return {"status": "Gemini Summary Service Running"}
 
+# Concurrency/queueing numbers for the Gemini call limiter
+@app.get("/stats")
+def read_stats():
+    return {"gemini": gemini_limiter.stats()}
+
+# Prometheus scrape target: request/stage histograms and limiter gauges
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    stats = gemini_limiter.stats()
+    return metrics.render({
+        "gemini_in_flight": stats["in_flight"],
+        "gemini_queue_depth": stats["queue_depth"],
+        "gemini_rejected": stats["rejected"],
+    })
+
 # Download and prepare image for Gemini
-async def download_image(url: str):
+async def download_image(url: str, semaphore: asyncio.Semaphore):
     """Download image from URL and return as bytes"""
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(url, timeout=10.0)
+        async with semaphore:
+            response = await http_client.get(url)
             response.raise_for_status()
             return response.content
     except Exception as e:
-        print(f"❌ Error downloading image {url}: {str(e)}")
+        log.warning("❌ Error downloading image %s: %s", url, e)
         return None
 
-# Generate summary endpoint
-@app.post("/generate-summary", response_model=SummaryResponse)
-async def generate_summary(req: SummaryRequest):
+def _read_media_file(key: str) -> bytes:
+    root = os.path.realpath(MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, key))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError("path escapes MEDIA_ROOT")
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap can't map empty files
+            return b""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+# Read image straight from shared storage, skipping the HTTP round-trip
+async def read_local_image(key: str):
+    """Read image from MEDIA_ROOT and return as bytes"""
     try:
-        print(f"📝 Received request - Style: {req.style}, Photos: {req.photo_count}, Image URLs: {len(req.image_urls)}, Note length: {len(req.note)}")
-        
-        # Define style prompts
-        style_prompts = {
-            "short": "Write a brief, simple 1–2 sentence summary",
-            "cheerful": "Write an upbeat, happy 2–3 sentence summary with positive energy and enthusiasm",
-            "nostalgic": "Write a warm, reflective 2–3 sentence summary that captures memories and sentiment",
-        }
-        style_prompt = style_prompts.get(req.style, style_prompts["short"])
+        if not MEDIA_ROOT:
+            raise ValueError("MEDIA_ROOT is not configured")
+        return await asyncio.to_thread(_read_media_file, key)
+    except Exception as e:
+        log.warning("❌ Error reading image %s: %s", key, e)
+        return None
 
-        # Build content for Gemini
-        parts = []
-        
-        # Add instruction text
-        if req.image_urls:
-            prompt_text = f"""You are writing as the person whose journal this is. {style_prompt} of YOUR day.
+async def fetch_images(urls: List[str], paths: List[str] = ()) -> List[Optional[bytes]]:
+    """Load all images concurrently; anything not done by the deadline is dropped."""
+    semaphore = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+    tasks = [asyncio.create_task(download_image(url, semaphore)) for url in urls]
+    tasks += [asyncio.create_task(read_local_image(key)) for key in paths]
+    if not tasks:
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=IMAGE_FETCH_DEADLINE)
+    for task in pending:
+        task.cancel()
+    if pending:
+        log.warning("⏱️ %d image(s) missed the %ss deadline", len(pending), IMAGE_FETCH_DEADLINE)
+    return [None if task in pending else task.result() for task in tasks]
+
+def prepare_image(image_bytes: bytes, max_edge: int, quality: int) -> bytes:
+    """Decode at reduced scale and re-encode as a JPEG no larger than max_edge.
+
+    Runs in image_pool, so it only takes picklable arguments.
+    """
+    img = PILImage.open(BytesIO(image_bytes))
+    if img.format == "JPEG" and img.mode in ("RGB", "L") and max(img.size) <= max_edge:
+        return image_bytes  # already model-ready, skip the re-encode
+
+    # JPEG decodes straight to 1/2, 1/4 or 1/8 scale; thumbnail() finishes the job
+    img.draft("RGB", (max_edge, max_edge))
+    img.thumbnail((max_edge, max_edge))
+
+    # Convert to RGB if needed
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Save as JPEG to bytes
+    img_byte_arr = BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=quality)
+    return img_byte_arr.getvalue()
+
+async def normalize_image(idx: int, image_bytes: Optional[bytes]) -> Optional[bytes]:
+    if not image_bytes:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            image_pool, prepare_image, image_bytes, IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY)
+    except Exception as e:
+        log.warning("❌ Invalid image %d: %s", idx + 1, e)
+        return None
+
+# Build the prompt (text + normalized images) for Gemini
+async def build_content(req: SummaryRequest) -> Content:
+    log.info("📝 Received request - Style: %s, Photos: %d, Image URLs: %d, Image paths: %d, Note length: %d",
+             req.style, req.photo_count, len(req.image_urls), len(req.image_paths), len(req.note))
+    
+    style_prompt = STYLE_PROMPTS.get(req.style, STYLE_PROMPTS["short"])
+
+    # Build content for Gemini
+    parts = []
+    
+    # Add instruction text
+    image_count = len(req.image_urls) + len(req.image_paths)
+    if image_count:
+        prompt_text = f"""You are writing as the person whose journal this is. {style_prompt} of YOUR day.
 
 You took {req.photo_count} photo(s) today. Look at the images and describe what YOU see and did.
 
@@ -100,8 +329,8 @@ CRITICAL RULES:
 Example format: "What a beautiful day! I captured some amazing sunset photos at the beach. The colors were incredible..."
 
 Now write YOUR summary:"""
-        else:
-            prompt_text = f"""You are writing as the person whose journal this is. {style_prompt} of YOUR day.
+    else:
+        prompt_text = f"""You are writing as the person whose journal this is. {style_prompt} of YOUR day.
 
 Your journal note: {req.note if req.note else "(No written note)"}
 
@@ -114,67 +343,138 @@ CRITICAL RULES:
 Example format: "Today was productive! I worked on some interesting research..."
 
 Now write YOUR summary:"""
+    
+    parts.append(Part(text=prompt_text))
+    
+    # Download and add images if they exist
+    if image_count:
+        log.info("🖼️ Loading %d images...", image_count)
+        urls = req.image_urls[:MAX_IMAGES]
+        with metrics.stage("fetch"):
+            images = await fetch_images(urls, req.image_paths[:MAX_IMAGES - len(urls)])
+        with metrics.stage("decode"):
+            prepared = await asyncio.gather(
+                *(normalize_image(idx, image_bytes) for idx, image_bytes in enumerate(images)))
+        for idx, img_bytes in enumerate(prepared):
+            if img_bytes:
+                # Add image part with inline_data
+                parts.append(Part(
+                    inline_data={
+                        'mime_type': 'image/jpeg',
+                        'data': base64.b64encode(img_bytes).decode('utf-8')
+                    }
+                ))
+                log.debug("✅ Image %d added to prompt", idx + 1)
+
+    # Create content with parts
+    return Content(parts=parts)
+
+# Generate summary endpoint
+@app.post("/generate-summary", response_model=SummaryResponse)
+async def generate_summary(req: SummaryRequest):
+    try:
+        content = await build_content(req)
+        log.info("🤖 Calling Gemini Vision API with %d parts...", len(content.parts))
         
-        parts.append(Part(text=prompt_text))
-        
-        # Download and add images if they exist
-        if req.image_urls:
-            print(f"🖼️ Downloading {len(req.image_urls)} images...")
-            for idx, image_url in enumerate(req.image_urls[:5]):  # Limit to 5 images
-                image_bytes = await download_image(image_url)
-                if image_bytes:
-                    try:
-                        # Verify it's a valid image
-                        img = PILImage.open(BytesIO(image_bytes))
-                        img.verify()
-                        
-                        # Re-open for processing (verify closes the file)
-                        img = PILImage.open(BytesIO(image_bytes))
-                        
-                        # Convert to RGB if needed
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        # Save as JPEG to bytes
-                        img_byte_arr = BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_bytes = img_byte_arr.getvalue()
-                        
-                        # Add image part with inline_data
-                        parts.append(Part(
-                            inline_data={
-                                'mime_type': 'image/jpeg',
-                                'data': base64.b64encode(img_bytes).decode('utf-8')
-                            }
-                        ))
-                        print(f"✅ Image {idx + 1} added to prompt")
-                    except Exception as e:
-                        print(f"❌ Invalid image {idx + 1}: {str(e)}")
-        
-        print(f"🤖 Calling Gemini Vision API with {len(parts)} parts...")
-        
-        # Create content with parts
-        content = Content(parts=parts)
-        
-        # Call Gemini API with vision support
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=content,
-        )
+        # Call Gemini API with vision support (async client: don't block the event loop)
+        async with gemini_limiter:
+            with metrics.stage("model"):
+                response = await client.aio.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=content,
+                )
         
         summary = response.text.strip()
-        print(f"✅ Summary generated: {summary[:100]}...")
+        log.info("✅ Summary generated: %s...", summary[:100])
         
         return SummaryResponse(summary=summary)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Error: %s", e)
         raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
 
+# Recap endpoint: combine already-written summaries (days of a week, or weeks
+# of a month) into one story. Text only, so the prompt stays small however
+# long the period is.
+@app.post("/generate-recap", response_model=SummaryResponse)
+async def generate_recap(req: RecapRequest):
+    log.info("📝 Received recap request - Period: %s, Style: %s, Parts: %d", req.period, req.style, len(req.parts))
+    if not req.parts:
+        raise HTTPException(status_code=400, detail="parts must not be empty")
+    unit = "week" if req.period == "month" else "day"
+    style_prompt = STYLE_PROMPTS.get(req.style, STYLE_PROMPTS["short"])
+    listed = "\n".join(f"- {part.label}: {part.text}" for part in req.parts)
+    prompt_text = f"""You are writing as the person whose journal this is. {style_prompt} of YOUR {req.period}, told as one story.
+
+Here is what you already wrote about each {unit}:
+{listed}
+
+CRITICAL RULES:
+- Write as "I" - you ARE this person
+- Start immediately with the recap - NO preambles like "Here's a recap" or "This week..."
+- NO meta-commentary about the task
+- Pick out the moments that stand out and connect them; don't go {unit} by {unit}
+
+Now write YOUR {req.period} recap:"""
+    try:
+        async with gemini_limiter:
+            with metrics.stage("model"):
+                response = await client.aio.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=Content(parts=[Part(text=prompt_text)]),
+                )
+        summary = response.text.strip()
+        log.info("✅ Recap generated: %s...", summary[:100])
+        return SummaryResponse(summary=summary)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error generating recap: {str(e)}")
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+# Streaming summary endpoint (Server-Sent Events): a {"delta"} message per
+# chunk as Gemini produces it, then a "done" event with the full summary
+# or an "error" event if generation fails part-way.
+@app.post("/generate-summary/stream")
+async def generate_summary_stream(req: SummaryRequest):
+    try:
+        content = await build_content(req)
+    except Exception as e:
+        log.exception("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
+
+    async def events():
+        chunks = []
+        try:
+            log.info("🤖 Streaming Gemini Vision API with %d parts...", len(content.parts))
+            async with gemini_limiter:
+                started = time.perf_counter()
+                with metrics.stage("model"):
+                    stream = await client.aio.models.generate_content_stream(model=GEMINI_MODEL, contents=content)
+                    async for chunk in stream:
+                        if chunk.text:
+                            if not chunks:
+                                metrics.record("first_token", time.perf_counter() - started)
+                            chunks.append(chunk.text)
+                            yield sse_event({"delta": chunk.text})
+            summary = "".join(chunks).strip()
+            log.info("✅ Summary streamed: %s...", summary[:100])
+            yield sse_event({"summary": summary}, event="done")
+        except Exception as e:
+            log.exception("❌ Error while streaming: %s", e)
+            yield sse_event({"detail": f"Error generating summary: {str(e)}"}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Run the server
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Starting Gemini Summary Service...")
+    log.info("🚀 Starting Gemini Summary Service...")
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,126 @@
+# Request and per-stage timings for the summary service.
+#
+# Every request runs under a correlation id: the X-Request-ID Django sends
+# (see backend/api/metrics.py), or a fresh one. Stages (image fetch, decode,
+# queueing for a model slot, the model call) are timed with `stage(...)`; the
+# totals go back as a Server-Timing header when the response starts and into
+# histograms served in the Prometheus text format by /metrics.
+#
+# Streaming responses send their headers before the model runs, so the model
+# stage shows up in /metrics and the logs but not in their Server-Timing.
+import contextvars
+import logging
+import re
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+request_id = contextvars.ContextVar("request_id", default="-")
+_stages = contextvars.ContextVar("stages", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.counts = defaultdict(lambda: [0] * (len(BUCKETS) + 1))  # last slot is +Inf
+        self.sums = Counter()
+
+    def observe(self, labels: tuple, seconds: float):
+        counts = self.counts[labels]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[labels] += seconds
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.counts.items()):
+            named = dict(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, n in zip((*BUCKETS, "+Inf"), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(**named, le=bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(**named)} {self.sums[labels]:.6f}")
+            lines.append(f"{self.name}_count{_labels(**named)} {cumulative}")
+        return lines
+
+
+# One event loop per process, so no locking needed
+requests_total = Counter()  # (path, method, status)
+request_seconds = Histogram("http_request_duration_seconds",
+                            "Time until the response started.", ("path", "method"))
+stage_seconds = Histogram("summary_stage_duration_seconds",
+                          "Time per stage: fetch, decode, queue, model, first_token.", ("stage",))
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` to every record ("-" outside a request)."""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+def record(name: str, seconds: float):
+    """Add ``seconds`` to stage ``name`` of the current request and to /metrics."""
+    stage_seconds.observe((name,), seconds)
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] += seconds
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+async def middleware(request, call_next):
+    rid = request.headers.get(REQUEST_ID_HEADER, "")
+    request_id.set(rid if REQUEST_ID_RE.match(rid) else uuid.uuid4().hex)
+    stages = Counter()
+    _stages.set(stages)
+    started = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    path = route.path if route else "unmatched"
+    requests_total[(path, request.method, str(response.status_code))] += 1
+    request_seconds.observe((path, request.method), total)
+    response.headers[REQUEST_ID_HEADER] = request_id.get()
+    response.headers["Server-Timing"] = ", ".join(
+        [f"total;dur={total * 1000:.1f}"] + [f"{name};dur={s * 1000:.1f}" for name, s in stages.items()])
+    return response
+
+
+def render(gauges: dict) -> str:
+    """Prometheus text for the counters above plus ``gauges`` ({name: value})."""
+    lines = ["# HELP http_requests_total Requests handled.", "# TYPE http_requests_total counter"]
+    lines += [f"http_requests_total{_labels(path=p, method=m, status=s)} {n}"
+              for (p, m, s), n in sorted(requests_total.items())]
+    lines += request_seconds.render() + stage_seconds.render()
+    for name, value in gauges.items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+# Run from this directory: python -m unittest tests
+# Uses the fake Gemini client, so no API key or network is needed.
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from io import BytesIO, StringIO
+from unittest import mock
+
+import httpx
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+
+os.environ.setdefault("GEMINI_FAKE", "1")
+os.environ.setdefault("FAKE_GEMINI_LATENCY", "0")
+os.environ.setdefault("FAKE_GEMINI_TOKEN_DELAY", "0")
+os.environ.setdefault("IMAGE_EXECUTOR", "thread")
+
+import main  # noqa: E402
+
+
+class MediaFileTests(unittest.TestCase):
+    def setUp(self):
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base)
+        self.root = os.path.join(base, "media")
+        self.outside = os.path.join(base, "outside.txt")
+        os.makedirs(os.path.join(self.root, "attachments"))
+        with open(os.path.join(self.root, "attachments", "a.jpg"), "wb") as f:
+            f.write(b"jpeg bytes")
+        with open(self.outside, "wb") as f:
+            f.write(b"secret")
+        patcher = mock.patch.object(main, "MEDIA_ROOT", self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_keys_under_media_root(self):
+        self.assertEqual(main._read_media_file("attachments/a.jpg"), b"jpeg bytes")
+
+    def test_rejects_keys_that_escape_media_root(self):
+        for key in ("../outside.txt", "attachments/../../outside.txt", self.outside):
+            with self.subTest(key=key), self.assertRaisesRegex(ValueError, "path escapes MEDIA_ROOT"):
+                main._read_media_file(key)
+
+    def test_escaping_key_is_dropped_not_served(self):
+        self.assertEqual(main.asyncio.run(main.fetch_images([], ["../outside.txt", "attachments/a.jpg"])),
+                         [None, b"jpeg bytes"])
+
+
+class FetchImagesTests(unittest.TestCase):
+    """Downloads go through the shared client (a stub transport here) in parallel, under one deadline."""
+
+    def fetch(self, urls, deadline=5.0):
+        events = {"active": 0, "peak": 0, "cancelled": []}
+
+        async def handler(request):
+            events["active"] += 1
+            events["peak"] = max(events["peak"], events["active"])
+            try:
+                await asyncio.sleep(30 if "slow" in request.url.path else 0.1)
+            except asyncio.CancelledError:
+                events["cancelled"].append(request.url.path)
+                raise
+            finally:
+                events["active"] -= 1
+            return httpx.Response(200, content=request.url.path.encode())
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                with mock.patch.object(main, "http_client", client), \
+                        mock.patch.object(main, "IMAGE_FETCH_DEADLINE", deadline):
+                    started = time.monotonic()
+                    images = await main.fetch_images(urls)
+                    elapsed = time.monotonic() - started
+                    await asyncio.sleep(0.01)  # let cancellations land before the loop's own cleanup
+                    return images, elapsed, dict(events, cancelled=list(events["cancelled"]))
+
+        return asyncio.run(scenario())
+
+    def test_fetches_in_parallel_and_keeps_order(self):
+        urls = [f"http://media/{i}.jpg" for i in range(4)]
+        images, elapsed, events = self.fetch(urls)
+        self.assertEqual(images, [f"/{i}.jpg".encode() for i in range(4)])
+        self.assertEqual(events["peak"], 4)
+        self.assertLess(elapsed, 0.35)  # one 0.1s round trip, not four
+
+    def test_deadline_drops_slow_images_and_cancels_them(self):
+        images, elapsed, events = self.fetch(["http://media/slow.jpg", "http://media/fast.jpg"], deadline=0.3)
+        self.assertEqual(images, [None, b"/fast.jpg"])
+        self.assertLess(elapsed, 1)
+        self.assertEqual(events["cancelled"], ["/slow.jpg"])
+
+
+def image_bytes(size, fmt="JPEG", mode="RGB") -> bytes:
+    out = BytesIO()
+    PILImage.new(mode, size, "red").save(out, format=fmt)
+    return out.getvalue()
+
+
+class PrepareImageTests(unittest.TestCase):
+    def test_small_jpeg_passes_through_untouched(self):
+        original = image_bytes((800, 600))
+        self.assertIs(main.prepare_image(original, 1024, 85), original)
+
+    def test_large_jpeg_is_downscaled_to_max_edge(self):
+        prepared = PILImage.open(BytesIO(main.prepare_image(image_bytes((4000, 3000)), 1024, 85)))
+        self.assertEqual((prepared.format, prepared.size), ("JPEG", (1024, 768)))
+
+    def test_other_formats_are_reencoded_as_rgb_jpeg(self):
+        prepared = PILImage.open(BytesIO(main.prepare_image(image_bytes((300, 200), "PNG", "RGBA"), 1024, 85)))
+        self.assertEqual((prepared.format, prepared.mode, prepared.size), ("JPEG", "RGB", (300, 200)))
+
+
+class ConcurrencyLimiterTests(unittest.TestCase):
+    def test_rejects_with_503_once_the_queue_is_full(self):
+        limiter = main.ConcurrencyLimiter(limit=1, max_queue=1)
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def hold():
+                async with limiter:
+                    await release.wait()
+
+            holder = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            with self.assertRaises(HTTPException) as rejected:
+                async with limiter:
+                    pass
+            release.set()
+            await asyncio.gather(holder, waiter)  # the queued call still gets its turn
+            return rejected.exception
+
+        rejected = asyncio.run(scenario())
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(limiter.stats()["rejected"], 1)
+        self.assertEqual(limiter.stats()["acquired"], 2)
+
+    def test_endpoint_answers_503_when_busy(self):
+        full = main.ConcurrencyLimiter(limit=1, max_queue=1)
+        full.waiting = 1
+        with mock.patch.object(main, "gemini_limiter", full), TestClient(main.app) as client:
+            response = client.post("/generate-summary", json={"note": "a walk", "style": "short"})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("busy", response.json()["detail"])
+
+
+class LoggingTests(unittest.TestCase):
+    def test_records_carry_the_request_id(self):
+        out = StringIO()
+        with mock.patch.object(main._log_handler, "stream", out), TestClient(main.app) as client:
+            client.post("/generate-recap", headers={"X-Request-ID": "req-42"},
+                        json={"period": "week", "style": "short", "parts": [{"label": "Mon", "text": "rain"}]})
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(" INFO [req-42] summary_service: " in line for line in lines), lines)
+
+
+if __name__ == "__main__":
+    unittest.main()